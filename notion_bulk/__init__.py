@@ -0,0 +1,4 @@
+"""Notion一括コピーツールの取得・キャッシュ・抽出・書き出し処理
+
+Streamlitに依存しないため、画面（notion_copy_tool.py）とCLI（notion_bulk.cli）の両方から使う。
+"""
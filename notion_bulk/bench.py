@@ -0,0 +1,206 @@
+"""モックサーバーを使った再現可能なベンチマーク
+
+    python -m notion_copy_tool bench --pages 500 --depth 2 --latency-ms 30 --out bench.json
+
+結果はJSONで書き出すので、リビジョン間で比較して性能の劣化を検知できる。
+"""
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from notion_client import Client
+
+from . import cache, fetcher
+from .extract import extract_text_from_blocks
+from .loader import iter_database_pages
+from .metrics import Metrics
+from .mock import MockNotionServer
+from .search import SearchIndex
+
+try:
+    import resource
+except ImportError:
+    # Windowsでは最大RSSを計測しない
+    resource = None
+
+BENCH_DATABASE_ID = "bench-db"
+# 検索レイテンシの計測に使うクエリ（単語・前方一致・複数語・N-gram）
+BENCH_QUERIES = ["仕様", "東京 会議", "cache", "rev", "データベース インデックス", "Notion API", "議事"]
+# 差分更新の計測で更新したことにするページの割合
+BENCH_TOUCH_RATIO = 0.05
+# テキスト抽出の計測に使う大きなページのブロック数
+BENCH_EXTRACT_BLOCKS = 20000
+
+def percentile(values, ratio):
+    """値の分位点を返す（最近傍法）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))], 3)
+
+def get_peak_rss_mb():
+    """このプロセスの最大RSS（MB）"""
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def get_git_revision():
+    """計測したソースのリビジョン（gitが使えなければNone）"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure_load(server, notion, max_depth, use_cache=False, incremental=False):
+    """1回分の読み込みを計測し、(計測結果, ページ一覧) を返す"""
+    server.reset_counts()
+    report = {}
+    metrics = Metrics()
+    pages_data = []
+    arrivals = []
+    started = time.perf_counter()
+    
+    for page_content in iter_database_pages(
+        notion, BENCH_DATABASE_ID, None, use_cache, incremental, max_depth, report, metrics
+    ):
+        pages_data.append(page_content)
+        arrivals.append((time.perf_counter() - started) * 1000)
+    
+    seconds = time.perf_counter() - started
+    requests = sum(count for name, count in server.counts.items() if name != 'rate_limited')
+    return {
+        'seconds': round(seconds, 3),
+        'pages': len(pages_data),
+        'pages_per_sec': round(len(pages_data) / seconds, 1) if seconds else None,
+        'time_to_page_p50_ms': percentile(arrivals, 0.5),
+        'time_to_page_p95_ms': percentile(arrivals, 0.95),
+        'requests': requests,
+        'requests_per_page': round(requests / len(pages_data), 2) if pages_data else None,
+        'rate_limited': server.counts['rate_limited'],
+        'bytes_received': server.bytes_sent,
+        'reused': report['reused'],
+        'refetched': report['refetched'],
+        'failed': len(report['failed']),
+        'stage_seconds': metrics.to_dict()['stage_seconds']
+    }, pages_data
+
+def measure_search(pages_data, repeat=20):
+    """検索インデックスの構築時間とクエリごとのレイテンシを計測"""
+    search_index = SearchIndex()
+    started = time.perf_counter()
+    search_index.sync(pages_data)
+    build_ms = (time.perf_counter() - started) * 1000
+    
+    pages_by_id = {page['id']: page for page in pages_data}
+    get_text = lambda page_id: f"{pages_by_id[page_id]['title']}\n{pages_by_id[page_id]['content']}"
+    latencies = []
+    for _ in range(repeat):
+        for query in BENCH_QUERIES:
+            started = time.perf_counter()
+            search_index.search(query, get_text)
+            latencies.append((time.perf_counter() - started) * 1000)
+    
+    return {
+        'build_ms': round(build_ms, 1),
+        'queries': len(latencies),
+        'query_p50_ms': percentile(latencies, 0.5),
+        'query_p95_ms': percentile(latencies, 0.95)
+    }
+
+def measure_extract(server, block_count=BENCH_EXTRACT_BLOCKS, repeat=5):
+    """大きなページ1つ分のブロックからのテキスト抽出のスループットを計測（Markdownあり・なし）"""
+    database = server.add_database("extract-db", 1, blocks_per_page=block_count)
+    blocks = server.build_blocks(database, database.page_ids[0])
+    
+    result = {'blocks': len(blocks)}
+    for name, markdown in (('plain', False), ('markdown', True)):
+        seconds = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            text = extract_text_from_blocks(blocks, markdown=markdown)
+            seconds.append(time.perf_counter() - started)
+        result[name] = {
+            'best_ms': round(min(seconds) * 1000, 1),
+            'blocks_per_sec': round(len(blocks) / min(seconds)),
+            'chars': len(text)
+        }
+    return result
+
+def run_benchmark(page_count=200, blocks_per_page=10, depth=1, children_per_block=3,
+                  latency_ms=20, rate_limit_ratio=0.0, rate=50, repeat=1, seed=0):
+    """モックサーバーに対して読み込み・キャッシュ・検索を計測し、結果を辞書で返す"""
+    params = {
+        'pages': page_count,
+        'blocks_per_page': blocks_per_page,
+        'depth': depth,
+        'children_per_block': children_per_block,
+        'latency_ms': latency_ms,
+        'rate_limit_ratio': rate_limit_ratio,
+        'rate': rate,
+        'repeat': repeat,
+        'seed': seed
+    }
+    previous_cache_dir = cache.CACHE_DIR
+    previous_rate = (fetcher.RATE_LIMIT_PER_SEC, fetcher.RATE_LIMIT_BURST)
+    
+    # 利用者のキャッシュを汚さないよう、一時ディレクトリで計測する
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            MockNotionServer(latency_ms, rate_limit_ratio, retry_after=0, seed=seed) as server:
+        cache.set_cache_dir(cache_dir)
+        fetcher.configure_rate_limit(rate, burst=max(int(rate), 1))
+        try:
+            server.add_database(BENCH_DATABASE_ID, page_count, blocks_per_page, depth, children_per_block)
+            notion = Client(auth="mock", base_url=server.url)
+            
+            cold_runs = []
+            for _ in range(repeat):
+                result, pages_data = measure_load(server, notion, depth)
+                cold_runs.append(result)
+            
+            cache_hit, _ = measure_load(server, notion, depth, use_cache=True)
+            # スナップショットがない場合（ページストアから本文を展開する）と比べる
+            cache.remove_snapshots()
+            cache_hit_store, _ = measure_load(server, notion, depth, use_cache=True)
+            unchanged, _ = measure_load(server, notion, depth, incremental=True)
+            
+            for page_id in server.databases[BENCH_DATABASE_ID].page_ids[::int(1 / BENCH_TOUCH_RATIO)]:
+                server.touch(page_id)
+            changed, pages_data = measure_load(server, notion, depth, incremental=True)
+            
+            # 同じページで1ブロックだけ更新した場合（どのブロックの子孫が編集されたか分からないので子孫も取得し直す）
+            for page_id in server.databases[BENCH_DATABASE_ID].page_ids[::int(1 / BENCH_TOUCH_RATIO)]:
+                server.touch_block(f"{page_id}.0")
+            block_changed, _ = measure_load(server, notion, depth, incremental=True)
+            
+            search = measure_search(pages_data)
+            extract = measure_extract(server)
+        finally:
+            cache.set_cache_dir(previous_cache_dir)
+            fetcher.configure_rate_limit(*previous_rate)
+    
+    return {
+        'revision': get_git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': params,
+        'cold_load': cold_runs[-1] if len(cold_runs) == 1 else {
+            'runs': cold_runs,
+            'seconds_min': min(run['seconds'] for run in cold_runs),
+            'seconds_median': percentile([run['seconds'] for run in cold_runs], 0.5)
+        },
+        'cache_hit': cache_hit,
+        'cache_hit_without_snapshot': cache_hit_store,
+        'incremental_unchanged': unchanged,
+        'incremental_changed': changed,
+        'incremental_block_changed': block_changed,
+        'search': search,
+        'extract': extract,
+        'peak_rss_mb': get_peak_rss_mb()
+    }
@@ -0,0 +1,573 @@
+"""キャッシュ（フィルタ条件ごとのページ一覧とページ本文・ブロックのストア）
+
+SQLite（WALモード）の1ファイルに保存するため、複数のStreamlitセッションやCLIから同時に
+読み書きしても壊れない。本文は圧縮してページの版（更新日時・取得深さ・Markdownか）ごとに1行で持ち、
+合計サイズが上限を超えたら最後に使われたのが古いものから削除する。
+"""
+import hashlib
+import heapq
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# キャッシュディレクトリ
+CACHE_DIR = ".notion_cache"
+# キャッシュのデータベースファイル名
+CACHE_DB_NAME = "cache.sqlite3"
+# ページ一覧のスナップショット（snapshot.py）を置くディレクトリ名
+SNAPSHOT_DIR_NAME = "snapshots"
+# ページ本文・ブロック・検索インデックス（圧縮後）とスナップショットの合計サイズの上限
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 上限を超えたときに削除して空ける割合（毎回の書き込みで削除が起きないよう少し多めに空ける）
+CACHE_EVICT_RATIO = 0.9
+# 何回書き込むごとに合計サイズを確かめるか
+CACHE_EVICT_CHECK_INTERVAL = 50
+# 本文の圧縮レベル（速度優先）
+COMPRESS_LEVEL = 3
+# 1回のSQLに埋め込むパラメータ数の上限（SQLiteの上限より小さくする）
+SQL_BATCH_SIZE = 500
+
+# ページ本文の表（画面のセッションが一覧に持っている版を、別の版の保存で消さないよう版ごとに1行）
+PAGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id TEXT NOT NULL,
+    database_id TEXT,
+    last_edited_time TEXT,
+    max_depth INTEGER NOT NULL,
+    markdown INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (page_id, last_edited_time, max_depth, markdown)
+);
+CREATE INDEX IF NOT EXISTS idx_pages_database ON pages (database_id);
+CREATE INDEX IF NOT EXISTS idx_pages_edited ON pages (last_edited_time);
+CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages (accessed_at);
+"""
+
+SCHEMA = PAGES_SCHEMA + """
+CREATE TABLE IF NOT EXISTS page_lists (
+    cache_key TEXT PRIMARY KEY,
+    database_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    data BLOB NOT NULL,
+    filters TEXT,
+    page_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_page_lists_database ON page_lists (database_id);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    block_id TEXT NOT NULL,
+    max_depth INTEGER NOT NULL,
+    markdown INTEGER NOT NULL DEFAULT 0,
+    last_edited_time TEXT,
+    page_id TEXT NOT NULL,
+    database_id TEXT,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (block_id, max_depth)
+);
+CREATE INDEX IF NOT EXISTS idx_blocks_page ON blocks (page_id);
+CREATE INDEX IF NOT EXISTS idx_blocks_database ON blocks (database_id);
+CREATE INDEX IF NOT EXISTS idx_blocks_accessed ON blocks (accessed_at);
+
+CREATE TABLE IF NOT EXISTS page_tags (
+    page_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (page_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_page_tags_tag ON page_tags (tag);
+
+CREATE TABLE IF NOT EXISTS search_indexes (
+    cache_key TEXT PRIMARY KEY,
+    database_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_search_indexes_database ON search_indexes (database_id);
+
+CREATE TABLE IF NOT EXISTS filter_options (
+    database_id TEXT PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# 以前のスキーマで作られたキャッシュに追加する列（表, 列, 型）
+ADDED_COLUMNS = [
+    ('page_lists', 'filters', 'TEXT'),
+    ('page_lists', 'page_count', 'INTEGER'),
+    ('pages', 'markdown', 'INTEGER NOT NULL DEFAULT 0'),
+    ('blocks', 'markdown', 'INTEGER NOT NULL DEFAULT 0')
+]
+
+# スレッドごとの接続（sqlite3の接続はスレッド間で共有しない）
+_local = threading.local()
+_write_count = 0
+# 読み込んだページ・ブロックの最後に使われた時刻（表 → キー → 時刻）。読み込みのたびに書き込まず、まとめて反映する
+_pending_access = {'pages': {}, 'blocks': {}}
+_pending_access_lock = threading.Lock()
+
+def set_cache_dir(cache_dir):
+    """キャッシュディレクトリを変更（CLIやベンチマークで作業用ディレクトリを分ける）"""
+    global CACHE_DIR
+    CACHE_DIR = cache_dir
+
+def set_cache_max_bytes(max_bytes):
+    """キャッシュの合計サイズの上限を変更"""
+    global CACHE_MAX_BYTES
+    CACHE_MAX_BYTES = max_bytes
+
+def get_cache_db_path():
+    return os.path.join(CACHE_DIR, CACHE_DB_NAME)
+
+def get_connection():
+    """このスレッドのキャッシュDBへの接続（キャッシュディレクトリが変わったら開き直す）"""
+    db_path = get_cache_db_path()
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.path == db_path:
+        return conn
+    if conn is not None:
+        conn.close()
+    
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # 書き込みが重なったら待つ（他のプロセスの書き込みは短いので長めに待ってよい）
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    for table, column, column_type in ADDED_COLUMNS:
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            except sqlite3.OperationalError:
+                # 別のプロセスが先に追加した
+                pass
+    migrate_page_versions(conn)
+    _local.conn = conn
+    _local.path = db_path
+    return conn
+
+def get_primary_key(conn, table):
+    return [row[1] for row in sorted(conn.execute(f"PRAGMA table_info({table})"), key=lambda row: row[5]) if row[5]]
+
+def migrate_page_versions(conn):
+    """ページIDごとに1行だった以前のページ本文の表を、版ごとに1行の表に作り直す"""
+    if get_primary_key(conn, 'pages') != ['page_id']:
+        return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # 別のプロセスが先に作り直した
+        if get_primary_key(conn, 'pages') != ['page_id']:
+            return
+        conn.execute("ALTER TABLE pages RENAME TO pages_old")
+        for index in ('idx_pages_database', 'idx_pages_edited', 'idx_pages_accessed'):
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        for statement in PAGES_SCHEMA.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute(
+            "INSERT OR IGNORE INTO pages "
+            "(page_id, database_id, last_edited_time, max_depth, markdown, size, accessed_at, body) "
+            "SELECT page_id, database_id, last_edited_time, max_depth, markdown, size, accessed_at, body "
+            "FROM pages_old"
+        )
+        conn.execute("DROP TABLE pages_old")
+
+def normalize_database_id(database_id):
+    """URLから取ったIDとAPIが返すハイフン付きのIDを同じものとして扱う"""
+    return database_id.replace('-', '') if database_id else None
+
+def get_cache_key(database_id, filters):
+    """データベースIDとフィルタ条件からキャッシュのキーを生成"""
+    filter_hash = hashlib.md5(str(filters).encode()).hexdigest()
+    return f"{normalize_database_id(database_id)}_{filter_hash}"
+
+def get_snapshot_path(database_id, filters, max_depth=0, markdown=False):
+    """ページ一覧のスナップショットのファイルパス（データベースID_フィルタのハッシュ_d深さ[_md].snap）"""
+    name = f"{get_cache_key(database_id, filters)}_d{max_depth}{'_md' if markdown else ''}.snap"
+    return os.path.join(CACHE_DIR, SNAPSHOT_DIR_NAME, name)
+
+def remove_snapshots(database_id=None):
+    """スナップショットを削除（database_idを指定すればそのデータベースの分だけ）"""
+    snapshot_dir = os.path.join(CACHE_DIR, SNAPSHOT_DIR_NAME)
+    if not os.path.isdir(snapshot_dir):
+        return
+    prefix = f"{normalize_database_id(database_id)}_" if database_id else ""
+    for name in os.listdir(snapshot_dir):
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(snapshot_dir, name))
+            except OSError:
+                # 他のプロセスが開いている（Windows）なら、次に開くときに古いと判定される
+                pass
+
+def list_snapshot_files():
+    """スナップショットのファイルを (最終使用時刻, パス, サイズ) で、使われたのが古い順に返す"""
+    snapshot_dir = os.path.join(CACHE_DIR, SNAPSHOT_DIR_NAME)
+    if not os.path.isdir(snapshot_dir):
+        return []
+    files = []
+    for name in os.listdir(snapshot_dir):
+        if not name.endswith(".snap"):
+            continue
+        path = os.path.join(snapshot_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # 他のプロセスが削除した
+            continue
+        files.append((stat.st_mtime, path, stat.st_size))
+    return sorted(files)
+
+def pack(data):
+    """JSONにして圧縮"""
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'), COMPRESS_LEVEL)
+
+def unpack(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+def save_cache(database_id, filters, data):
+    """キャッシュを保存（本文はページストアに置き、ここにはページ一覧のみ保持）"""
+    refs = [{'id': page['id'], 'last_edited_time': page.get('last_edited_time')} for page in data]
+    get_connection().execute(
+        "INSERT OR REPLACE INTO page_lists "
+        "(cache_key, database_id, timestamp, data, filters, page_count) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            get_cache_key(database_id, filters), normalize_database_id(database_id), time.time(), pack(refs),
+            json.dumps(filters, ensure_ascii=False), len(refs)
+        )
+    )
+
+def load_cache(database_id, filters):
+    """キャッシュを読み込み"""
+    try:
+        row = get_connection().execute(
+            "SELECT timestamp, data FROM page_lists WHERE cache_key = ?",
+            (get_cache_key(database_id, filters),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'timestamp': datetime.fromtimestamp(row[0]), 'data': unpack(row[1])}
+    except (sqlite3.Error, ValueError, zlib.error):
+        return None
+
+def list_cached_datasets():
+    """キャッシュにあるページ一覧（データベースとフィルタの組）を、更新が新しい順に返す"""
+    rows = get_connection().execute(
+        "SELECT database_id, filters, page_count, timestamp FROM page_lists ORDER BY timestamp DESC"
+    ).fetchall()
+    return [
+        {
+            'database_id': database_id,
+            'filters': json.loads(filters) if filters else None,
+            'page_count': page_count,
+            'timestamp': datetime.fromtimestamp(timestamp)
+        }
+        for database_id, filters, page_count, timestamp in rows
+    ]
+
+def save_search_index_state(database_id, filters, state):
+    """検索インデックス（SearchIndex.to_stateの辞書）を保存"""
+    blob = zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL), COMPRESS_LEVEL)
+    get_connection().execute(
+        "INSERT OR REPLACE INTO search_indexes (cache_key, database_id, size, data) VALUES (?, ?, ?, ?)",
+        (get_cache_key(database_id, filters), normalize_database_id(database_id), len(blob), blob)
+    )
+    maybe_evict()
+
+def load_search_index_state(database_id, filters):
+    """保存済みの検索インデックスの辞書を読み込み"""
+    try:
+        row = get_connection().execute(
+            "SELECT data FROM search_indexes WHERE cache_key = ?",
+            (get_cache_key(database_id, filters),)
+        ).fetchone()
+        return pickle.loads(zlib.decompress(row[0])) if row else None
+    except (sqlite3.Error, pickle.UnpicklingError, zlib.error):
+        return None
+
+def save_filter_options_cache(database_id, options, relation_database_id=None, relation=None,
+                              relation_fetched_at=None):
+    """フィルタ設定とリレーション先のページID→タイトル・更新日時の対応を保存
+    
+    relation_fetched_atは対応を全件取得した時刻（UNIX時間）で、有効期限の判断に使う。
+    """
+    cache_data = {
+        'options': options,
+        'relation_database_id': relation_database_id,
+        'relation': relation or {},
+        'relation_fetched_at': relation_fetched_at
+    }
+    get_connection().execute(
+        "INSERT OR REPLACE INTO filter_options (database_id, timestamp, data) VALUES (?, ?, ?)",
+        (normalize_database_id(database_id), time.time(), pack(cache_data))
+    )
+
+def load_filter_options_cache(database_id):
+    """フィルタ設定のキャッシュを読み込み"""
+    try:
+        row = get_connection().execute(
+            "SELECT timestamp, data FROM filter_options WHERE database_id = ?",
+            (normalize_database_id(database_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'timestamp': datetime.fromtimestamp(row[0]), **unpack(row[1])}
+    except (sqlite3.Error, ValueError, zlib.error):
+        return None
+
+def save_page_to_store(page_data):
+    """ページ本文をストアに保存（タグは検索用に別の表にも保存）
+    
+    同じページの別の版（更新前・別の深さ・Markdownか）は消さずに残し、使われなくなれば上限を超えたときに削除される。
+    """
+    body = pack(page_data)
+    conn = get_connection()
+    # 同じページを別のフィルタや別のプロセスから同時に書き込んでも1つのトランザクションで置き換える
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "INSERT OR REPLACE INTO pages "
+            "(page_id, database_id, last_edited_time, max_depth, markdown, size, accessed_at, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                page_data['id'], normalize_database_id(page_data.get('database_id')),
+                page_data.get('last_edited_time'), page_data.get('max_depth', 0),
+                int(page_data.get('markdown', False)), len(body), time.time(), body
+            )
+        )
+        conn.execute("DELETE FROM page_tags WHERE page_id = ?", (page_data['id'],))
+        conn.executemany(
+            "INSERT OR IGNORE INTO page_tags (page_id, tag) VALUES (?, ?)",
+            [(page_data['id'], tag) for tag in page_data.get('tags', [])]
+        )
+    maybe_evict()
+
+def load_page_from_store(page_id, last_edited_time, max_depth=0, markdown=False):
+    """ページIDと最終更新日時・取得深さ・Markdownで描画したかが一致する本文をストアから読み込み"""
+    if not last_edited_time:
+        return None
+    try:
+        conn = get_connection()
+        row = conn.execute(
+            "SELECT body FROM pages "
+            "WHERE page_id = ? AND last_edited_time = ? AND max_depth = ? AND markdown = ?",
+            (page_id, last_edited_time, max_depth, int(markdown))
+        ).fetchone()
+        if row is None:
+            return None
+        page_data = unpack(row[0])
+        # 使われたページほど削除されにくくする（書き込みはflush_access_timesでまとめて行う）
+        note_access('pages', [(page_id, last_edited_time, max_depth, int(markdown))])
+        return page_data
+    except (sqlite3.Error, ValueError, zlib.error):
+        return None
+
+def save_blocks_to_store(page_id, database_id, max_depth, entries, block_ids, markdown=False):
+    """ページのトップレベルのブロック（子孫と抽出したテキスト付き）を保存
+    
+    entriesは {'block': ブロック, 'text': テキスト, 'number': 番号付きリストの番号,
+    'page_edited_time': 保存したときのページの更新日時} のリスト。
+    block_idsはページの現在のトップレベルのブロックIDで、ここにないブロックは削除済みとして消す。
+    markdownはテキストをMarkdownで描画したかで、読み込むときに一致したものだけを使う。
+    """
+    rows = []
+    now = time.time()
+    for entry in entries:
+        body = pack(entry)
+        rows.append((
+            entry['block']['id'], max_depth, int(markdown), entry['block'].get('last_edited_time'),
+            page_id, normalize_database_id(database_id), len(body), now, body
+        ))
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO blocks "
+            "(block_id, max_depth, markdown, last_edited_time, page_id, database_id, size, accessed_at, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        current = set(block_ids)
+        removed = [
+            (block_id, max_depth) for (block_id,) in conn.execute(
+                "SELECT block_id FROM blocks WHERE page_id = ? AND max_depth = ?", (page_id, max_depth)
+            ).fetchall()
+            if block_id not in current
+        ]
+        conn.executemany("DELETE FROM blocks WHERE block_id = ? AND max_depth = ?", removed)
+    maybe_evict()
+
+def load_blocks_from_store(block_versions, max_depth=0, markdown=False):
+    """(ブロックID, 最終更新日時) のリストのうち、保存済みで更新されていないブロックを {ブロックID: entry} で返す"""
+    entries = {}
+    versions = {block_id: last_edited_time for block_id, last_edited_time in block_versions if last_edited_time}
+    block_ids = list(versions)
+    try:
+        conn = get_connection()
+        for start in range(0, len(block_ids), SQL_BATCH_SIZE):
+            batch = block_ids[start:start + SQL_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT block_id, last_edited_time, body FROM blocks "
+                f"WHERE max_depth = ? AND markdown = ? AND block_id IN ({','.join('?' * len(batch))})",
+                (max_depth, int(markdown), *batch)
+            ).fetchall()
+            for block_id, last_edited_time, body in rows:
+                if versions[block_id] == last_edited_time:
+                    entries[block_id] = unpack(body)
+        note_access('blocks', [(block_id, max_depth) for block_id in entries])
+    except (sqlite3.Error, ValueError, zlib.error):
+        return {}
+    return entries
+
+def note_access(table, keys):
+    """ページ（キーは (ページID, 更新日時, 深さ, Markdownか)）・ブロック（キーは (ブロックID, 深さ)）が使われたことを記録"""
+    now = time.time()
+    with _pending_access_lock:
+        pending = _pending_access[table]
+        for key in keys:
+            pending[key] = now
+
+def flush_access_times():
+    """記録しておいた最後に使われた時刻を1回のトランザクションで書き込む（読み込みの終わりに呼ぶ）"""
+    with _pending_access_lock:
+        pages = _pending_access['pages']
+        blocks = _pending_access['blocks']
+        _pending_access['pages'] = {}
+        _pending_access['blocks'] = {}
+    if not pages and not blocks:
+        return
+    try:
+        conn = get_connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE pages SET accessed_at = ? "
+                "WHERE page_id = ? AND last_edited_time = ? AND max_depth = ? AND markdown = ?",
+                [(accessed_at, *version) for version, accessed_at in pages.items()]
+            )
+            conn.executemany(
+                "UPDATE blocks SET accessed_at = ? WHERE block_id = ? AND max_depth = ?",
+                [(accessed_at, block_id, max_depth) for (block_id, max_depth), accessed_at in blocks.items()]
+            )
+    except sqlite3.Error:
+        # 削除の順序が少し変わるだけなので、書き込めなければ捨てる
+        pass
+
+def get_cache_size():
+    """ページ本文・ブロック・検索インデックス（圧縮後）とスナップショットの合計サイズ（バイト数）"""
+    conn = get_connection()
+    pages_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+    blocks_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blocks").fetchone()[0]
+    index_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM search_indexes").fetchone()[0]
+    snapshots_size = sum(size for _, _, size in list_snapshot_files())
+    return pages_size + blocks_size + index_size + snapshots_size
+
+def evict(max_bytes=None):
+    """合計サイズが上限を超えていたら、最後に使われたのが古いページ・ブロック・スナップショットから削除し、削除件数を返す
+    
+    スナップショットの最終使用時刻はファイルの更新日時（開くたびに更新される）。
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    # 最近使われたページを消さないよう、記録しておいた時刻を先に反映する
+    flush_access_times()
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        excess = get_cache_size() - max_bytes
+        if excess <= 0:
+            return 0
+        excess += int(max_bytes * (1 - CACHE_EVICT_RATIO))
+        
+        page_rowids = []
+        page_ids = []
+        block_rowids = []
+        snapshot_paths = []
+        rows = conn.execute(
+            "SELECT 'pages', rowid, page_id, size, accessed_at FROM pages "
+            "UNION ALL SELECT 'blocks', rowid, block_id, size, accessed_at FROM blocks "
+            "ORDER BY accessed_at"
+        )
+        snapshots = (
+            ('snapshots', None, path, size, used_at) for used_at, path, size in list_snapshot_files()
+        )
+        for table, rowid, key, size, _ in heapq.merge(rows, snapshots, key=lambda row: row[4]):
+            if excess <= 0:
+                break
+            if table == 'pages':
+                page_rowids.append((rowid,))
+                page_ids.append((key, key))
+            elif table == 'blocks':
+                block_rowids.append((rowid,))
+            else:
+                snapshot_paths.append(key)
+            excess -= size
+        conn.executemany("DELETE FROM pages WHERE rowid = ?", page_rowids)
+        # タグはページの版がすべて消えたときだけ消す
+        conn.executemany(
+            "DELETE FROM page_tags WHERE page_id = ? AND NOT EXISTS (SELECT 1 FROM pages WHERE page_id = ?)",
+            page_ids
+        )
+        conn.executemany("DELETE FROM blocks WHERE rowid = ?", block_rowids)
+    for path in snapshot_paths:
+        try:
+            os.remove(path)
+        except OSError:
+            # 他のプロセスが開いている（Windows）か、先に削除した
+            pass
+    return len(page_rowids) + len(block_rowids) + len(snapshot_paths)
+
+def maybe_evict():
+    """一定回数の書き込みごとに上限を確かめる"""
+    global _write_count
+    _write_count += 1
+    if _write_count % CACHE_EVICT_CHECK_INTERVAL == 0:
+        evict()
+
+def clear_database_cache(database_id):
+    """1つのデータベースのページ一覧・本文・検索インデックス・フィルタ設定を削除"""
+    database_id = normalize_database_id(database_id)
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "DELETE FROM page_tags WHERE page_id IN (SELECT page_id FROM pages WHERE database_id = ?)",
+            (database_id,)
+        )
+        conn.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+        conn.execute("DELETE FROM blocks WHERE database_id = ?", (database_id,))
+        conn.execute("DELETE FROM page_lists WHERE database_id = ?", (database_id,))
+        # 複数のデータベースをまとめた検索インデックスはIDをカンマでつないだキーで保存されている
+        conn.execute(
+            "DELETE FROM search_indexes WHERE instr(',' || database_id || ',', ',' || ? || ',') > 0",
+            (database_id,)
+        )
+        conn.execute("DELETE FROM filter_options WHERE database_id = ?", (database_id,))
+    remove_snapshots(database_id)
+
+def clear_cache():
+    """キャッシュをすべて削除（他のプロセスが開いていてもよいよう、ファイルは消さずに中身を消す）"""
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in ('page_lists', 'pages', 'blocks', 'page_tags', 'search_indexes', 'filter_options'):
+            conn.execute(f"DELETE FROM {table}")
+    conn.execute("VACUUM")
+    remove_snapshots()
+    
+    # 以前の形式（pickleファイル）のキャッシュも削除
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if name == "pages" and os.path.isdir(path):
+            shutil.rmtree(path)
+        elif name.endswith(".pkl"):
+            os.remove(path)
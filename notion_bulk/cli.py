@@ -0,0 +1,209 @@
+"""ヘッドレス実行用のコマンドライン（Streamlitなしで読み込み・書き出しを行う）
+
+使い方:
+    python -m notion_copy_tool export --db <データベースID> --category A --out pages.zip
+    python -m notion_copy_tool export --db <ID1> --db <ID2> --out pages.jsonl
+    python -m notion_copy_tool warm --db <データベースID>
+    python -m notion_copy_tool warm --db <ID1> --db <ID2> --every 30 --rate-share 0.3
+    python -m notion_copy_tool bench --pages 500 --out bench.json
+
+APIトークンは --token か環境変数 NOTION_TOKEN で指定する。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from notion_client import Client
+
+from .cache import set_cache_dir, set_cache_max_bytes
+from .export import write_export
+from .loader import (
+    DEFAULT_MAX_BLOCK_DEPTH,
+    build_database_filters,
+    get_filter_options,
+    iter_databases_pages,
+)
+from .metrics import Metrics
+from .search import build_search_index
+from .warmer import DEFAULT_WARM_RATE_SHARE, CacheWarmer
+
+COMMANDS = ('export', 'warm', 'bench')
+
+def log(message):
+    """進捗を標準エラー出力に表示"""
+    print(message, file=sys.stderr, flush=True)
+
+def build_parser():
+    """引数パーサーを構築"""
+    parser = argparse.ArgumentParser(
+        prog="python -m notion_copy_tool",
+        description="Notionデータベースのページをブラウザなしで読み込み・書き出し"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--token", default=os.environ.get("NOTION_TOKEN", ""),
+                        help="Notion APIトークン（省略時は環境変数 NOTION_TOKEN）")
+    common.add_argument("--db", action='append', required=True,
+                        help="データベースID（複数指定でまとめて読み込み）")
+    common.add_argument("--category", action='append', default=[], help="カテゴリ（複数指定でOR条件）")
+    common.add_argument("--tag", action='append', default=[], help="DB_tag（複数指定でOR条件）")
+    common.add_argument("--mode", choices=['cache', 'incremental', 'full'], default='incremental',
+                        help="cache: キャッシュをそのまま使用 / incremental: 差分更新 / full: 全件再取得")
+    common.add_argument("--depth", type=int, default=DEFAULT_MAX_BLOCK_DEPTH, help="子ブロックの最大深さ")
+    common.add_argument("--markdown", action='store_true',
+                        help="太字・リンクなどの装飾をMarkdownで出力（キャッシュは装飾なしと別に持つ）")
+    common.add_argument("--cache-dir", help="キャッシュディレクトリ（省略時は .notion_cache）")
+    common.add_argument("--cache-max-mb", type=int,
+                        help="キャッシュの上限（MB、超えたら最後に使われたのが古いページから削除）")
+    common.add_argument("--metrics-out",
+                        help="計測値の出力先（.prom / .txt ならPrometheus形式、それ以外はJSON）")
+    
+    export_parser = subparsers.add_parser('export', parents=[common], help="ページを読み込んでファイルに書き出す")
+    export_parser.add_argument("--out", required=True, help="出力ファイル")
+    export_parser.add_argument("--format", choices=['txt', 'zip', 'jsonl'],
+                               help="出力形式（省略時は出力ファイルの拡張子から判断）")
+    
+    warm_parser = subparsers.add_parser('warm', parents=[common], help="キャッシュと検索インデックスだけを最新にする")
+    warm_parser.add_argument("--every", type=float,
+                             help="指定した分ごとに差分更新を繰り返す（Ctrl+Cで終了）")
+    warm_parser.add_argument("--rate-share", type=float, default=DEFAULT_WARM_RATE_SHARE,
+                             help="--every のときに使うレート制限の割合（0〜1）")
+    
+    bench_parser = subparsers.add_parser('bench', help="モックサーバーで読み込み・キャッシュ・検索の性能を計測")
+    bench_parser.add_argument("--pages", type=int, default=200, help="ページ数")
+    bench_parser.add_argument("--blocks", type=int, default=10, help="1ページのトップレベルブロック数")
+    bench_parser.add_argument("--depth", type=int, default=1, help="子ブロックの深さ")
+    bench_parser.add_argument("--children", type=int, default=3, help="1ブロックあたりの子ブロック数")
+    bench_parser.add_argument("--latency-ms", type=float, default=20, help="1リクエストあたりの応答遅延")
+    bench_parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="429を返す割合（0〜1）")
+    bench_parser.add_argument("--rate", type=float, default=50, help="レートリミッタの速度（リクエスト/秒）")
+    bench_parser.add_argument("--repeat", type=int, default=1, help="全件読み込みの繰り返し回数")
+    bench_parser.add_argument("--seed", type=int, default=0, help="合成データの乱数シード")
+    bench_parser.add_argument("--out", help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    
+    return parser
+
+def load_pages(args, metrics=None):
+    """引数の条件でページを読み込み、結果を表示して返す"""
+    metrics = metrics or Metrics()
+    notion = Client(auth=args.token)
+    # データベースごとの選択肢に合わせて絞り込む（リレーションのDB_tagはタイトルからIDに変換する）
+    filter_options_by_db = None
+    if args.category or args.tag:
+        filter_options_by_db = {
+            database_id: get_filter_options(notion, database_id, metrics=metrics) for database_id in args.db
+        }
+    sources = build_database_filters(args.db, args.category, args.tag, filter_options_by_db)
+    report = {}
+    pages_data = []
+    started = time.monotonic()
+    
+    for page_content in iter_databases_pages(
+        notion, sources,
+        use_cache=args.mode == 'cache',
+        incremental=args.mode == 'incremental',
+        max_depth=args.depth,
+        report=report,
+        metrics=metrics,
+        markdown=args.markdown
+    ):
+        pages_data.append(page_content)
+        if len(pages_data) % 100 == 0:
+            log(f"読み込み中: {len(pages_data)}/{len(report['order'])} ページ")
+    
+    # 取得できた順ではなくクエリ結果の順に並べ直す
+    order = {page_id: index for index, page_id in enumerate(report['order'])}
+    pages_data.sort(key=lambda page: order.get(page['id'], len(order)))
+    
+    log(
+        f"{len(pages_data)}件のページを読み込みました ({time.monotonic() - started:.1f}秒 / "
+        f"再利用 {report['reused']}件 / 再取得 {report['refetched']}件 / 削除 {report['removed']}件)"
+    )
+    for failed in report['failed']:
+        log(f"取得できなかったページ: {failed['id']}: {failed['error']}")
+    
+    metrics.add_stage('total', time.monotonic() - started)
+    with metrics.stage('search_index'):
+        build_search_index(','.join(args.db), [filter_query for _, filter_query in sources], pages_data)
+    return pages_data, report
+
+def run_bench(args):
+    """ベンチマークを実行して結果のJSONを書き出す"""
+    from .bench import run_benchmark
+    
+    result = run_benchmark(
+        page_count=args.pages,
+        blocks_per_page=args.blocks,
+        depth=args.depth,
+        children_per_block=args.children,
+        latency_ms=args.latency_ms,
+        rate_limit_ratio=args.rate_limit_ratio,
+        rate=args.rate,
+        repeat=args.repeat,
+        seed=args.seed
+    )
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+        log(f"{args.out} に計測結果を書き出しました")
+    else:
+        print(output)
+    return 0
+
+def run_warmer(args):
+    """データベースごとに差分更新を一定間隔で繰り返す（レート制限の一部だけを使う）"""
+    presets = [
+        {'database_id': database_id, 'categories': args.category, 'tags': args.tag}
+        for database_id in args.db
+    ]
+    warmer = CacheWarmer(
+        Client(auth=args.token), presets,
+        interval_sec=args.every * 60,
+        rate_share=args.rate_share,
+        max_depth=args.depth,
+        markdown=args.markdown,
+        on_log=log
+    )
+    try:
+        warmer.run()
+    except KeyboardInterrupt:
+        warmer.stop()
+    return 0
+
+def main(argv=None):
+    """CLIのエントリポイント（終了コードを返す）"""
+    args = build_parser().parse_args(argv)
+    if args.command == 'bench':
+        return run_bench(args)
+    
+    if args.cache_dir:
+        set_cache_dir(args.cache_dir)
+    if args.cache_max_mb:
+        set_cache_max_bytes(args.cache_max_mb * 1024 * 1024)
+    if not args.token:
+        log("APIトークンを --token か環境変数 NOTION_TOKEN で指定してください")
+        return 2
+    
+    if args.command == 'warm' and args.every:
+        return run_warmer(args)
+    
+    metrics = Metrics()
+    pages_data, report = load_pages(args, metrics)
+    
+    if args.command == 'export':
+        export_format = args.format or os.path.splitext(args.out)[1].lstrip('.')
+        if export_format not in ('txt', 'zip', 'jsonl'):
+            export_format = 'txt'
+        write_export(pages_data, export_format, args.out)
+        log(f"{args.out} に書き出しました ({export_format})")
+    
+    if args.metrics_out:
+        metrics.write(args.metrics_out)
+        log(f"{args.metrics_out} に計測値を書き出しました")
+    
+    # 取得できなかったページがあれば、cronなどで検知できるよう失敗扱いにする
+    return 1 if report['failed'] else 0
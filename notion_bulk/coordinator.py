@@ -0,0 +1,139 @@
+"""プロセス内で同じ読み込みを1回にまとめるコーディネーター
+
+Streamlitでは利用者ごとのセッションが同じプロセスで動く。同じトークン・データベース・フィルタ・
+深さの読み込みが実行中なら、新しく取得せずにその読み込みの結果を途中から一緒に受け取る。
+別の条件の読み込み同士でも、同じページの本文の取得はローダーで1回にまとめられ、
+レート制限はトークンごとに全セッションで共有される。
+受け手が1人もいなくなった読み込み（条件を変えて再実行した場合など）は中断する。
+"""
+import hashlib
+import threading
+from contextlib import nullcontext
+
+from .loader import iter_databases_pages
+from .metrics import Metrics
+from .scheduler import FetchScheduler
+
+# 実行中の読み込み（キー → SharedLoad）
+_loads = {}
+_loads_lock = threading.Lock()
+
+def get_load_key(notion, sources, use_cache, incremental, max_depth, markdown=False):
+    """読み込みを同一視するためのキー（トークンはハッシュにして保持する）"""
+    auth_hash = hashlib.sha256(str(notion.options.auth).encode()).hexdigest()
+    return (
+        auth_hash,
+        tuple((database_id, str(filter_query)) for database_id, filter_query in sources),
+        use_cache,
+        incremental,
+        max_depth,
+        markdown
+    )
+
+class SharedLoad:
+    """バックグラウンドで1回だけ実行し、取得できたページを複数の受け手に配る読み込み"""
+    
+    def __init__(self, key, notion, sources, use_cache, incremental, max_depth, markdown, metrics):
+        self.key = key
+        self.args = (notion, sources, use_cache, incremental, max_depth, markdown)
+        self.metrics = metrics
+        self.report = {}
+        self.pages = []
+        self.error = None
+        self.done = False
+        self.condition = threading.Condition()
+        self.scheduler = FetchScheduler()
+        # 結果を受け取っているセッションの数（_loads_lockで保護）
+        self.receivers = 0
+    
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+    
+    def run(self):
+        # 中断されても取得済みのページはキャッシュに残り、次回の読み込みで再利用される
+        try:
+            notion, sources, use_cache, incremental, max_depth, markdown = self.args
+            for page in iter_databases_pages(
+                notion, sources, use_cache, incremental, max_depth, self.report, self.metrics,
+                scheduler=self.scheduler, markdown=markdown
+            ):
+                with self.condition:
+                    self.pages.append(page)
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with _loads_lock:
+                if _loads.get(self.key) is self:
+                    del _loads[self.key]
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+    
+    def iter_pages(self, report, metrics):
+        """これまでに取得したページから順に返し、読み込みが終わるまで待ち続ける"""
+        try:
+            yield from self.iter_received_pages(report, metrics)
+        finally:
+            self.leave()
+    
+    def leave(self):
+        """受け手を1人減らし、誰も受け取らなくなった読み込みは中断する（新しいセッションは相乗りしない）"""
+        with _loads_lock:
+            self.receivers -= 1
+            if self.receivers > 0 or self.done:
+                return
+            if _loads.get(self.key) is self:
+                del _loads[self.key]
+        self.scheduler.cancel()
+    
+    def iter_received_pages(self, report, metrics):
+        index = 0
+        while True:
+            with self.condition:
+                if index >= len(self.pages) and not self.done:
+                    # 相乗りした側では、他のセッションの取得を待った時間として集計する
+                    waiting = metrics.stage('shared_wait') if metrics is not self.metrics else nullcontext()
+                    with waiting:
+                        while index >= len(self.pages) and not self.done:
+                            self.condition.wait()
+                pages = self.pages[index:]
+                done = self.done
+                report.update(self.report)
+            index += len(pages)
+            yield from pages
+            if done and index >= len(self.pages):
+                break
+        
+        report.update(self.report)
+        if self.error is not None:
+            raise self.error
+
+def iter_shared_databases_pages(notion, sources, use_cache=True, incremental=False, max_depth=0,
+                                report=None, metrics=None, priority_ids=(), markdown=False):
+    """iter_databases_pages と同じ結果を返すジェネレータ（同じ条件の実行中の読み込みがあれば相乗りする）
+    
+    最初に読み込みを始めたセッションのmetricsにAPIの計測値が集計され、相乗りした側には待ち時間だけが入る。
+    priority_ids（画面に表示中・選択中のページなど）の本文は他のページより先に取得する。
+    ジェネレータを途中で閉じると受け手から外れ、受け手がいなくなれば取得を中断する。
+    """
+    if report is None:
+        report = {}
+    metrics = metrics or Metrics()
+    key = get_load_key(notion, sources, use_cache, incremental, max_depth, markdown)
+    
+    with _loads_lock:
+        shared_load = _loads.get(key)
+        if shared_load is None:
+            shared_load = _loads[key] = SharedLoad(
+                key, notion, sources, use_cache, incremental, max_depth, markdown, metrics
+            )
+            shared_load.scheduler.prioritize(priority_ids)
+            shared_load.start()
+        else:
+            shared_load.scheduler.prioritize(priority_ids)
+        shared_load.receivers += 1
+    
+    report['shared'] = shared_load.metrics is not metrics
+    yield from shared_load.iter_pages(report, metrics)
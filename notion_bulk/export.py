@@ -0,0 +1,68 @@
+"""選択ページのファイル書き出し"""
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+# エクスポート形式ごとのMIMEタイプ
+EXPORT_MIME_TYPES = {
+    "txt": "text/plain",
+    "zip": "application/zip",
+    "jsonl": "application/x-ndjson"
+}
+
+def iter_selected_pages(pages_data, selection):
+    """選択中のページを一覧の順に返す"""
+    for page in pages_data:
+        if page['id'] in selection:
+            yield page
+
+def make_export_filename(page):
+    """ZIP内のファイル名を生成（ファイル名に使えない文字を置き換え、IDで重複を避ける）"""
+    safe_title = re.sub(r'[\\/:*?"<>|\r\n\t]', '_', page['title']).strip() or "無題"
+    return f"{safe_title[:80]}_{page['id'].replace('-', '')[:8]}.md"
+
+def write_export(pages, export_format, export_path=None):
+    """選択ページをファイル（指定がなければ一時ファイル）へ1ページずつ書き出し、パスを返す"""
+    if export_path is None:
+        fd, export_path = tempfile.mkstemp(prefix="notion_export_", suffix=f".{export_format}")
+        os.close(fd)
+    
+    try:
+        if export_format == "zip":
+            with zipfile.ZipFile(export_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for page in pages:
+                    zf.writestr(make_export_filename(page), f"# {page['title']}\n\n{page['content']}\n")
+        
+        elif export_format == "jsonl":
+            with open(export_path, 'w', encoding='utf-8') as f:
+                for page in pages:
+                    record = {
+                        'id': page['id'],
+                        'database_id': page.get('database_id'),
+                        'title': page['title'],
+                        'category': page.get('category', ''),
+                        'tags': page.get('tags', []),
+                        'char_count': page['char_count'],
+                        'line_count': page['line_count'],
+                        'last_edited_time': page.get('last_edited_time'),
+                        'content': page['content']
+                    }
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    f.write("\n")
+        
+        else:
+            # 従来の「区切り線 + ページを空行で連結」と同じ内容を書き出す
+            with open(export_path, 'w', encoding='utf-8') as f:
+                f.write("\n\n" + "=" * 80)
+                for index, page in enumerate(pages):
+                    if index > 0:
+                        f.write("\n\n")
+                    f.write(f"# {page['title']}\n\n")
+                    f.write(page['content'])
+    except:
+        os.remove(export_path)
+        raise
+    
+    return export_path
@@ -0,0 +1,181 @@
+"""Notionブロックからのテキスト抽出
+
+ブロックの種類ごとの変換関数を BLOCK_RENDERERS に登録し、1ブロックにつき1回の辞書引きで変換する。
+対応していない種類を追加するときは register_block_renderer で関数を登録する。
+
+    @register_block_renderer('audio')
+    def render_audio(block, payload, context):
+        return f"🔊 {get_file_url(payload)}"
+"""
+
+# 本文を持たないレイアウト用ブロック（子ブロックを同じ階層として扱う）
+LAYOUT_BLOCK_TYPES = {'column_list', 'column', 'synced_block'}
+# 子ブロックを変換関数の中で描画するブロック（子ブロックを改めて展開しない）
+SELF_RENDERED_BLOCK_TYPES = {'table'}
+# ブロックの種類 → 変換関数 (block, payload, context) -> テキスト（Noneや空文字なら出力しない）
+BLOCK_RENDERERS = {}
+# Markdownで描画するときの装飾（適用順に内側から）
+MARKDOWN_ANNOTATIONS = (('code', '`'), ('bold', '**'), ('italic', '*'), ('strikethrough', '~~'))
+
+def register_block_renderer(*block_types):
+    """ブロックの種類に変換関数を登録するデコレータ"""
+    def decorator(renderer):
+        for block_type in block_types:
+            BLOCK_RENDERERS[block_type] = renderer
+        return renderer
+    return decorator
+
+def render_rich_text(rich_text, markdown=False):
+    """rich_text配列を文字列に変換（markdownなら装飾とリンクをMarkdownで表す）"""
+    if not markdown:
+        if len(rich_text) == 1:
+            return rich_text[0].get('plain_text', '')
+        return ''.join([t.get('plain_text', '') for t in rich_text])
+    
+    parts = []
+    for t in rich_text:
+        text = t.get('plain_text', '')
+        if not text:
+            continue
+        if t.get('type') == 'equation':
+            parts.append(f"${text}$")
+            continue
+        annotations = t.get('annotations') or {}
+        # 前後の空白は装飾の外に出す（"** bold**" はMarkdownとして解釈されない）
+        stripped = text.strip()
+        if stripped:
+            for name, mark in MARKDOWN_ANNOTATIONS:
+                if annotations.get(name):
+                    stripped = f"{mark}{stripped}{mark}"
+            if t.get('href'):
+                stripped = f"[{stripped}]({t['href']})"
+            text = text.replace(text.strip(), stripped, 1)
+        parts.append(text)
+    return ''.join(parts)
+
+def text_renderer(prefix="", suffix=""):
+    """rich_textの前後に記号を付けるだけの変換関数を作る"""
+    def render(block, payload, context):
+        text = render_rich_text(payload.get('rich_text', []), context['markdown'])
+        return f"{prefix}{text}{suffix}" if text else None
+    return render
+
+def get_file_url(payload):
+    """画像・ファイル・埋め込みなどのURL（Notionにアップロードされたファイルも外部ファイルも）"""
+    if 'url' in payload:
+        return payload['url']
+    return payload.get(payload.get('type'), {}).get('url', '')
+
+BLOCK_RENDERERS.update({
+    'paragraph': text_renderer(),
+    'heading_1': text_renderer("\n# ", "\n"),
+    'heading_2': text_renderer("\n## ", "\n"),
+    'heading_3': text_renderer("\n### ", "\n"),
+    'bulleted_list_item': text_renderer("• "),
+    'quote': text_renderer("> "),
+    'toggle': text_renderer("▸ ")
+})
+
+@register_block_renderer('numbered_list_item')
+def render_numbered_list_item(block, payload, context):
+    text = render_rich_text(payload.get('rich_text', []), context['markdown'])
+    return f"{context['number']}. {text}" if text else None
+
+@register_block_renderer('to_do')
+def render_to_do(block, payload, context):
+    text = render_rich_text(payload.get('rich_text', []), context['markdown'])
+    return f"{'☑' if payload.get('checked') else '☐'} {text}" if text else None
+
+@register_block_renderer('callout')
+def render_callout(block, payload, context):
+    text = render_rich_text(payload.get('rich_text', []), context['markdown'])
+    icon = payload.get('icon') or {}
+    emoji = icon.get('emoji', '💡') if icon.get('type', 'emoji') == 'emoji' else '💡'
+    return f"{emoji} {text}" if text else None
+
+@register_block_renderer('code')
+def render_code(block, payload, context):
+    # コードは装飾せずにそのまま出す
+    text = render_rich_text(payload.get('rich_text', []))
+    return f"```{payload.get('language', '')}\n{text}\n```" if text else None
+
+@register_block_renderer('equation')
+def render_equation(block, payload, context):
+    expression = payload.get('expression', '')
+    return f"$$\n{expression}\n$$" if expression else None
+
+@register_block_renderer('divider')
+def render_divider(block, payload, context):
+    return "---"
+
+@register_block_renderer('child_page')
+def render_child_page(block, payload, context):
+    return f"📄 {payload.get('title') or '無題'}"
+
+@register_block_renderer('child_database')
+def render_child_database(block, payload, context):
+    return f"🗂️ {payload.get('title') or '無題'}"
+
+@register_block_renderer('bookmark', 'embed', 'link_preview', 'image', 'video', 'file', 'pdf')
+def render_link(block, payload, context):
+    url = get_file_url(payload)
+    caption = render_rich_text(payload.get('caption', []), context['markdown'])
+    if context['markdown'] and url:
+        return f"[{caption or url}]({url})"
+    return ' '.join(part for part in (caption, url) if part) or None
+
+@register_block_renderer('table')
+def render_table(block, payload, context):
+    """表の行（子ブロックのtable_row）を | 区切りで出力"""
+    lines = []
+    for row in block.get('children') or []:
+        cells = row.get('table_row', {}).get('cells', [])
+        lines.append("| " + " | ".join(render_rich_text(cell, context['markdown']) for cell in cells) + " |")
+        # 見出し行のあとに区切りを入れる（Markdownの表になる）
+        if len(lines) == 1 and payload.get('has_column_header'):
+            lines.append("|" + "---|" * len(cells))
+    return '\n'.join(lines) or None
+
+def indent_text(text, depth):
+    """階層の深さに応じて各行をインデント"""
+    if depth == 0:
+        return text
+    indent = "    " * depth
+    return '\n'.join(indent + line if line else line for line in text.split('\n'))
+
+def next_list_number(context, block_type):
+    """このブロックの番号付きリストの番号（連続している間だけ番号を進め、それ以外は0）"""
+    return context['number'] + 1 if block_type == 'numbered_list_item' else 0
+
+def render_block(block, depth, context):
+    """1つのブロックと子ブロックのテキスト（contextは兄弟の間で引き継ぐ番号などの状態）"""
+    block_type = block.get('type')
+    context['number'] = next_list_number(context, block_type)
+    text_content = []
+    
+    renderer = BLOCK_RENDERERS.get(block_type)
+    if renderer is not None:
+        text = renderer(block, block.get(block_type) or {}, context)
+        if text:
+            text_content.append(indent_text(text, depth))
+    
+    children = block.get('children')
+    if children and block_type not in SELF_RENDERED_BLOCK_TYPES:
+        child_depth = depth if block_type in LAYOUT_BLOCK_TYPES else depth + 1
+        child_text = extract_text_from_blocks(children, child_depth, context['markdown'])
+        if child_text:
+            text_content.append(child_text)
+    
+    return '\n'.join(text_content)
+
+def extract_text_from_blocks(blocks, depth=0, markdown=False):
+    """ブロックからテキストを抽出（子ブロックはインデントして展開、markdownなら装飾もMarkdownで出力）"""
+    text_content = []
+    context = {'markdown': markdown, 'number': 0}
+    
+    for block in blocks:
+        text = render_block(block, depth, context)
+        if text:
+            text_content.append(text)
+    
+    return '\n'.join(text_content)
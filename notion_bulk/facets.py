@@ -0,0 +1,70 @@
+"""読み込み済みのページをカテゴリ・タグ・更新日でその場で絞り込むためのファセット索引
+
+データベース全体を1回読み込んでおけば、条件を変えるたびにAPIを呼ばずに絞り込める。
+同じファセット内の値はOR、ファセット同士はANDで組み合わせる（build_filter_queryと同じ）。
+"""
+from bisect import bisect_left
+from datetime import timedelta
+
+# 絞り込みに使うファセット（ページの項目名）
+FACETS = ('category', 'tags')
+
+def get_facet_values(page, facet):
+    """ページのファセットの値のリスト（複数選択のカテゴリは ", " で連結されているので分ける）"""
+    value = page.get(facet)
+    if not value:
+        return []
+    if isinstance(value, str):
+        return value.split(', ')
+    return list(value)
+
+class FacetIndex:
+    """ファセットの値 → ページIDの集合 と、更新日時順のページIDを持つ索引"""
+    
+    def __init__(self, pages):
+        self.all_ids = set()
+        self.postings = {facet: {} for facet in FACETS}
+        edited = []
+        for page in pages:
+            self.all_ids.add(page['id'])
+            for facet in FACETS:
+                for value in get_facet_values(page, facet):
+                    self.postings[facet].setdefault(value, set()).add(page['id'])
+            if page.get('last_edited_time'):
+                edited.append((page['last_edited_time'], page['id']))
+        edited.sort()
+        self.edited_times = [edited_time for edited_time, _ in edited]
+        self.edited_ids = [page_id for _, page_id in edited]
+    
+    def values(self, facet):
+        """ファセットの値を、該当するページが多い順に返す"""
+        return sorted(self.postings[facet], key=lambda value: (-len(self.postings[facet][value]), value))
+    
+    def match_edited(self, edited_range):
+        """更新日が (開始日, 終了日) の範囲（両端を含む、Noneなら制限なし）にあるページIDの集合"""
+        start, end = edited_range
+        low = bisect_left(self.edited_times, start.isoformat()) if start else 0
+        high = (
+            bisect_left(self.edited_times, (end + timedelta(days=1)).isoformat())
+            if end else len(self.edited_times)
+        )
+        return set(self.edited_ids[low:high])
+    
+    def filter(self, selection, edited_range=None, exclude=None):
+        """選択された値（ファセット → 値のリスト）に一致するページIDの集合（excludeのファセットは無視）"""
+        result = self.all_ids
+        for facet, values in selection.items():
+            if facet == exclude or not values:
+                continue
+            matched = set()
+            for value in values:
+                matched |= self.postings[facet].get(value, set())
+            result = result & matched
+        if edited_range and any(edited_range):
+            result = result & self.match_edited(edited_range)
+        return result
+    
+    def counts(self, facet, selection, edited_range=None):
+        """ファセットの値ごとに、その値を選んだときに残るページ数（他のファセットの選択は適用したまま）"""
+        base = self.filter(selection, edited_range, exclude=facet)
+        return {value: len(base & page_ids) for value, page_ids in self.postings[facet].items()}
@@ -0,0 +1,234 @@
+"""レート制限を考慮したNotion APIの非同期呼び出し"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+
+import httpx
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from .metrics import Metrics, get_endpoint_name
+
+# Notion APIのレート制限（平均約3リクエスト/秒）
+RATE_LIMIT_PER_SEC = 3
+RATE_LIMIT_BURST = 5
+# 同時リクエスト数（レスポンスに応じて増減させる）
+INITIAL_CONCURRENCY = 3
+MAX_CONCURRENCY = 10
+# リトライ設定（429 / 5xx / タイムアウト）
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_MAX_SEC = 30.0
+
+# APIトークンごとのレートリミッタ（Notionのレート制限はインテグレーション単位のため）
+_shared_buckets = {}
+_shared_buckets_lock = threading.Lock()
+
+def configure_rate_limit(rate, burst=None):
+    """以降に作成するレートリミッタの速度を変更（ベンチマークやモックサーバー向け）"""
+    global RATE_LIMIT_PER_SEC, RATE_LIMIT_BURST
+    RATE_LIMIT_PER_SEC = rate
+    if burst is not None:
+        RATE_LIMIT_BURST = burst
+
+class TokenBucket:
+    """トークンバケット方式のレートリミッタ
+    
+    状態はスレッドのロックで守るため、別々のスレッド・イベントループで動くフェッチャー
+    （Streamlitの複数セッションなど）から同じバケットを共有できる。
+    """
+    
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate or RATE_LIMIT_PER_SEC
+        self.capacity = capacity or RATE_LIMIT_BURST
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+    
+    def pause(self, seconds):
+        """Retry-After を受けたら全リクエストをまとめて待たせる"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+    
+    def try_acquire(self):
+        """トークンを1つ取得し、取得できなければ待つべき秒数を返す（取得できたら0）"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+    
+    async def acquire(self):
+        """トークンを1つ取得（足りなければ補充されるまで待機）"""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+class BudgetShareBucket:
+    """共有のレートリミッタの一部（share）だけを使うリミッタ（バックグラウンドの事前取得向け）"""
+    
+    def __init__(self, parent, share):
+        self.parent = parent
+        self.own = TokenBucket(parent.rate * share, max(1, parent.capacity * share))
+    
+    def pause(self, seconds):
+        self.parent.pause(seconds)
+    
+    async def acquire(self):
+        # 自分の割り当てを使い切らない範囲で、共有のバケットからもトークンを取る
+        await self.own.acquire()
+        await self.parent.acquire()
+
+def get_shared_bucket(auth):
+    """APIトークンごとにプロセス全体で共有するレートリミッタ（速度の設定が変わったら作り直す）"""
+    key = (hashlib.sha256(str(auth).encode()).hexdigest(), RATE_LIMIT_PER_SEC, RATE_LIMIT_BURST)
+    with _shared_buckets_lock:
+        bucket = _shared_buckets.get(key)
+        if bucket is None:
+            bucket = _shared_buckets[key] = TokenBucket()
+        return bucket
+
+class AdaptiveConcurrency:
+    """AIMD方式で同時リクエスト数を調整するセマフォ"""
+    
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=1, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.active = 0
+        self.condition = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+    
+    def on_success(self):
+        """成功したら少しずつ同時数を増やす（加算的増加）"""
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+    
+    def on_throttle(self):
+        """429を受けたら同時数を半分にする（乗算的減少）"""
+        self.limit = max(self.minimum, self.limit / 2)
+
+class NotionFetcher:
+    """レート制限を考慮してNotion APIを呼び出す非同期クライアント"""
+    
+    def __init__(self, client, bucket=None, concurrency=None, max_retries=MAX_RETRIES, metrics=None):
+        self.client = client
+        self.bucket = bucket or TokenBucket()
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.max_retries = max_retries
+        self.metrics = metrics or Metrics()
+        self.request_count = 0
+        self.retry_count = 0
+    
+    def get_backoff(self, attempt, error=None):
+        """リトライまでの待ち時間を計算（Retry-After優先、なければ指数バックオフ+ジッター）"""
+        headers = getattr(error, 'headers', None)
+        retry_after = headers.get('retry-after') if headers is not None else None
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, 1)
+            except ValueError:
+                pass
+        return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** attempt)))
+    
+    async def call(self, method, **kwargs):
+        """APIを呼び出し、429 / 5xx / タイムアウトはバックオフしてリトライ"""
+        endpoint = get_endpoint_name(method)
+        attempt = 0
+        while True:
+            with self.metrics.stage('rate_limit_wait'):
+                await self.bucket.acquire()
+            async with self.concurrency:
+                self.request_count += 1
+                started = time.perf_counter()
+                try:
+                    result = await method(**kwargs)
+                except HTTPResponseError as e:
+                    self.metrics.record_api(endpoint, time.perf_counter() - started, e.status)
+                    if (e.status != 429 and e.status < 500) or attempt >= self.max_retries:
+                        raise
+                    delay = self.get_backoff(attempt, e)
+                    throttled = True
+                    if e.status == 429:
+                        self.concurrency.on_throttle()
+                        self.bucket.pause(delay)
+                except (RequestTimeoutError, httpx.TransportError):
+                    self.metrics.record_api(endpoint, time.perf_counter() - started, 599)
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self.get_backoff(attempt)
+                    throttled = False
+                else:
+                    self.metrics.record_api(endpoint, time.perf_counter() - started)
+                    self.concurrency.on_success()
+                    return result
+            
+            attempt += 1
+            self.retry_count += 1
+            self.metrics.record_retry(endpoint, delay, throttled)
+            await asyncio.sleep(delay)
+    
+    async def paginate(self, method, **kwargs):
+        """ページネーションされたAPIを最後まで取得"""
+        results = []
+        has_more = True
+        start_cursor = None
+        
+        while has_more:
+            if start_cursor:
+                response = await self.call(method, start_cursor=start_cursor, **kwargs)
+            else:
+                response = await self.call(method, **kwargs)
+            
+            results.extend(response.get('results', []))
+            has_more = response.get('has_more', False)
+            start_cursor = response.get('next_cursor')
+        
+        return results
+
+def run_with_fetcher(notion, func, *args, metrics=None, rate_share=None):
+    """非同期フェッチャーを用意してコルーチン関数を実行（レート制限は同じトークンの全実行で共有）
+    
+    rate_shareを指定すると、レート制限のうちその割合までしか使わない。
+    """
+    metrics = metrics or Metrics()
+    
+    async def on_response(response):
+        # 受信バイト数を数えるため本文を先に読み込む（notion-clientは読み込み済みの本文をそのまま使う）
+        await response.aread()
+        metrics.record_bytes(response.num_bytes_downloaded)
+    
+    async def runner():
+        client = AsyncClient(auth=notion.options.auth, base_url=notion.options.base_url)
+        client.client.event_hooks['response'].append(on_response)
+        try:
+            bucket = get_shared_bucket(notion.options.auth)
+            if rate_share:
+                bucket = BudgetShareBucket(bucket, rate_share)
+            fetcher = NotionFetcher(client, bucket=bucket, metrics=metrics)
+            return await func(fetcher, *args)
+        finally:
+            await client.aclose()
+    
+    return asyncio.run(runner())
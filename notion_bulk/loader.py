@@ -0,0 +1,707 @@
+"""データベースのページ一覧・本文の読み込み（キャッシュ・差分更新対応）"""
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+
+from .cache import (
+    flush_access_times,
+    load_blocks_from_store,
+    load_cache,
+    load_filter_options_cache,
+    load_page_from_store,
+    save_blocks_to_store,
+    save_cache,
+    save_filter_options_cache,
+    save_page_to_store,
+)
+from .extract import LAYOUT_BLOCK_TYPES, next_list_number, render_block
+from .fetcher import run_with_fetcher
+from .metrics import Metrics
+from .scheduler import HOLD, FetchScheduler
+from .snapshot import SnapshotWriter, open_snapshot
+
+# 子ブロックをたどる深さのデフォルト（0ならトップレベルのみ）
+DEFAULT_MAX_BLOCK_DEPTH = 3
+# 子ブロックを持っていても辿らないブロック（別ページ・別DB）
+SKIP_CHILDREN_BLOCK_TYPES = {'child_page', 'child_database'}
+# ブロックストアの子孫を再利用しないブロック（中身の更新が自身の更新日時に表れない）
+# 同期ブロックは同期元の編集で、レイアウト用ブロックは列の中の編集で中身が変わる
+UNCACHED_BLOCK_TYPES = LAYOUT_BLOCK_TYPES | {'synced_block'}
+# ページ単位で取得を進めるワーカー数（実際の同時リクエスト数はフェッチャーで制御）
+PAGE_WORKERS = 20
+# リレーション先のタイトルの対応を全件取得し直すまでの時間（それまでは更新されたページだけを反映する）
+FILTER_OPTIONS_TTL_SEC = 60 * 60
+
+class FetchCancelled(Exception):
+    """取得中のページの読み込みが中断された（待っていた別の読み込みは自分で取得し直す）"""
+
+# プロセス内で取得中のページ（(ページID, 最終更新日時, 深さ) → 結果を受け取るFuture）
+_inflight_pages = {}
+_inflight_pages_lock = threading.Lock()
+
+def has_child_blocks(block):
+    """子ブロックを辿るブロックか"""
+    return block.get('has_children') and block.get('type') not in SKIP_CHILDREN_BLOCK_TYPES
+
+async def fetch_block_children(fetcher, block_id, max_depth=0, depth=0, synced=None):
+    """子ブロックを取得し、max_depthまで兄弟のサブツリーを並列にたどる
+    
+    syncedを渡すと、同じ同期ブロックの中身は（別のページにあっても）その辞書を共有する間で1回だけ取得する。
+    """
+    blocks = await fetcher.paginate(fetcher.client.blocks.children.list, block_id=block_id)
+    if depth < max_depth:
+        await expand_block_children(fetcher, blocks, max_depth, depth, synced)
+    return blocks
+
+async def expand_block_children(fetcher, blocks, max_depth, depth, synced=None):
+    """blocksのうち子ブロックを持つものに、max_depthまでの子孫を children として付ける"""
+    parents = [block for block in blocks if has_child_blocks(block)]
+    # 兄弟のサブツリーは同時に取得（リクエスト数はフェッチャーのレート制限で共有）
+    children_list = await asyncio.gather(*[
+        fetch_synced_children(fetcher, block, max_depth, depth, synced)
+        if block.get('type') == 'synced_block' and synced is not None
+        else fetch_block_children(fetcher, block['id'], max_depth, depth + 1, synced)
+        for block in parents
+    ])
+    for block, children in zip(parents, children_list):
+        block['children'] = children
+
+async def fetch_synced_children(fetcher, block, max_depth, depth, synced):
+    """同期ブロックの中身を同期元ごとに1回だけ取得（同期元へのアクセス権がなくても取れるよう、このブロックから取得）"""
+    synced_from = (block.get('synced_block') or {}).get('synced_from') or {}
+    key = (synced_from.get('block_id') or block['id'], depth)
+    task = synced.get(key)
+    if task is None:
+        task = synced[key] = asyncio.ensure_future(
+            fetch_block_children(fetcher, block['id'], max_depth, depth + 1, synced)
+        )
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        # 失敗した取得は共有せず、次のページでは取得し直す
+        if synced.get(key) is task:
+            del synced[key]
+        raise
+
+def get_property_names(prop_value):
+    """select / multi_select / relation プロパティの値を名前（relationはページID）のリストで返す"""
+    prop_type = prop_value.get('type')
+    if prop_type == 'select':
+        option = prop_value.get('select')
+        return [option.get('name')] if option else []
+    if prop_type == 'multi_select':
+        return [option.get('name') for option in prop_value.get('multi_select', [])]
+    if prop_type == 'relation':
+        return [relation.get('id') for relation in prop_value.get('relation', [])]
+    return []
+
+def get_page_title(page):
+    """ページオブジェクトのタイトル（なければ空文字）"""
+    for prop_name, prop_value in page.get('properties', {}).items():
+        if prop_value.get('type') == 'title':
+            return ''.join([t.get('plain_text', '') for t in prop_value.get('title', [])])
+    return ""
+
+def get_page_metadata(page):
+    """クエリ結果のページオブジェクトからタイトル・カテゴリ・タグ・更新日時を取り出す"""
+    properties = page.get('properties', {})
+    
+    return {
+        'title': get_page_title(page) or "無題",
+        'category': ', '.join(get_property_names(properties.get('カテゴリ', {}))),
+        'tags': get_property_names(properties.get('DB_tag', {})),
+        'database_id': page.get('parent', {}).get('database_id'),
+        'last_edited_time': page.get('last_edited_time')
+    }
+
+def is_block_reusable(block):
+    """ブロックストアに保存した子孫とテキストを、更新日時が同じなら再利用してよいブロックか"""
+    return bool(has_child_blocks(block)) and block.get('type') not in UNCACHED_BLOCK_TYPES
+
+async def get_page_content(fetcher, page, max_depth=0, synced=None, reuse_blocks=True, markdown=False):
+    """クエリ結果のページオブジェクトから本文を取得（失敗時は例外を送出）
+    
+    タイトルやプロパティはクエリ結果のものを使うので、pages.retrieveは呼ばない。
+    トップレベルのブロック一覧は毎回取得し、子ブロックを持つブロックのうちブロックストアに
+    保存したときからブロックとページの更新日時が変わっていないものは、保存済みの子孫と
+    抽出済みのテキストを使う（子孫を取得しない）。子孫のブロックを編集しても親のブロックの
+    更新日時は変わらず、ページの更新日時からはどのブロックの子孫が編集されたか分からないので、
+    ページの更新日時が進んでいればreuse_blocksがFalse（全件再取得）のときと同じく子孫を取得し直す。
+    子ブロックを持たないブロックは一覧に中身が含まれているので、保存せずにその場で変換する。
+    markdownなら太字・リンクなどの装飾をMarkdownで出力する（ブロックストアには描画方法ごとに保存）。
+    """
+    page_id = page['id']
+    metrics = fetcher.metrics
+    with metrics.stage('blocks'):
+        blocks = await fetcher.paginate(fetcher.client.blocks.children.list, block_id=page_id)
+        
+        stored = {}
+        page_edited_time = page.get('last_edited_time')
+        reusable = [block for block in blocks if is_block_reusable(block)] if max_depth > 0 else []
+        if reusable and reuse_blocks:
+            with metrics.stage('block_cache_read'):
+                stored = load_blocks_from_store(
+                    [(block['id'], block.get('last_edited_time')) for block in reusable], max_depth, markdown
+                )
+            # 保存した後にページが編集されていれば、どのブロックの子孫が編集されたか分からない
+            stored = {
+                block_id: entry for block_id, entry in stored.items()
+                if page_edited_time and entry.get('page_edited_time') == page_edited_time
+            }
+            metrics.record_block_cache(len(stored), len(reusable) - len(stored))
+        
+        # 更新されたブロックだけ子孫を取得する
+        blocks = [stored[block['id']]['block'] if block['id'] in stored else block for block in blocks]
+        if max_depth > 0:
+            await expand_block_children(
+                fetcher, [block for block in blocks if block['id'] not in stored], max_depth, 0, synced
+            )
+    
+    with metrics.stage('extract'):
+        texts = []
+        new_entries = []
+        context = {'markdown': markdown, 'number': 0}
+        for block in blocks:
+            entry = stored.get(block['id'])
+            # 番号付きリストのテキストは前のブロックによって番号が変わるので、番号が同じときだけ使う
+            number = next_list_number(context, block.get('type'))
+            if entry is not None and entry['number'] == number:
+                context['number'] = number
+                texts.append(entry['text'])
+                continue
+            text = render_block(block, 0, context)
+            texts.append(text)
+            if is_block_reusable(block):
+                new_entries.append({
+                    'block': block, 'text': text, 'number': context['number'],
+                    'page_edited_time': page_edited_time
+                })
+        content = '\n'.join(text for text in texts if text)
+    
+    if new_entries:
+        save_in_background(
+            metrics, 'block_cache_write', save_blocks_to_store,
+            page_id, page.get('parent', {}).get('database_id'), max_depth,
+            new_entries, [block['id'] for block in blocks if is_block_reusable(block)], markdown
+        )
+    
+    return {
+        'id': page_id,
+        **get_page_metadata(page),
+        'content': content,
+        'char_count': len(content),
+        'line_count': content.count('\n') + 1,
+        'max_depth': max_depth,
+        'markdown': markdown
+    }
+
+def save_in_background(metrics, stage_name, save, *args):
+    """ストアへの書き込みをイベントループの外のスレッドで行い、完了を待たずに取得を続ける
+    
+    他のプロセスの書き込み中は待たされるため、取得中のリクエストを止めないようにする。
+    asyncio.runは終了時に実行中の書き込みを待つので、読み込みが終わるまでには書き込まれる。
+    書き込めなかった場合は保存しないだけ（次回の読み込みで取得し直す）。
+    """
+    def run():
+        with metrics.stage(stage_name):
+            save(*args)
+    
+    future = asyncio.get_running_loop().run_in_executor(None, run)
+    # 失敗しても「例外が取り出されなかった」という警告を出さない
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+def get_schema_options(prop):
+    """select / multi_select プロパティのスキーマから選択肢の名前を取り出す"""
+    prop_type = prop.get('type')
+    if prop_type in ('select', 'multi_select'):
+        return [opt.get('name') for opt in prop.get(prop_type, {}).get('options', [])]
+    return []
+
+async def fetch_relation_titles(fetcher, relation_db_id, relation=None):
+    """リレーション先のページID→タイトル・更新日時の対応を取得
+    
+    前回の対応を渡すと、その最終更新日時以降に更新されたページだけを取得して反映する。
+    アーカイブ・ゴミ箱に移動されたページは対応から除く（結果に現れない完全な削除は全件取得で除かれる）。
+    """
+    relation = dict(relation or {})
+    query_params = {"database_id": relation_db_id}
+    edited_times = [entry['last_edited_time'] for entry in relation.values() if entry['last_edited_time']]
+    if edited_times:
+        query_params["filter"] = {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": max(edited_times)}
+        }
+    
+    for page in await fetcher.paginate(fetcher.client.databases.query, **query_params):
+        if page.get('archived') or page.get('in_trash'):
+            relation.pop(page['id'], None)
+            continue
+        relation[page['id']] = {
+            'title': get_page_title(page),
+            'last_edited_time': page.get('last_edited_time')
+        }
+    return relation
+
+async def fetch_filter_options(fetcher, database_id, cached=None):
+    """データベースのスキーマからフィルタオプションを取得し、(オプション, リレーション先DB ID, 対応) を返す
+    
+    cachedを渡すと、リレーション先が同じならその対応に更新されたページだけを反映する（Noneなら全件取得）。
+    """
+    database = await fetcher.call(fetcher.client.databases.retrieve, database_id=database_id)
+    properties = database.get('properties', {})
+    
+    options = {'categories': [], 'db_tags': [], 'db_tag_titles': {}}
+    options['database_title'] = ''.join([t.get('plain_text', '') for t in database.get('title', [])])
+    options['categories'] = get_schema_options(properties.get('カテゴリ', {}))
+    
+    prop = properties.get('DB_tag', {})
+    if prop.get('type') != 'relation':
+        options['db_tags'] = get_schema_options(prop)
+        return options, None, {}
+    
+    relation_db_id = prop.get('relation', {}).get('database_id')
+    if not relation_db_id:
+        return options, None, {}
+    
+    # リレーション先が変わっていなければ前回の対応に差分を反映する
+    relation = None
+    if cached and cached.get('relation_database_id') == relation_db_id:
+        relation = cached['relation']
+    relation = await fetch_relation_titles(fetcher, relation_db_id, relation)
+    
+    options['db_tag_titles'] = {page_id: entry['title'] for page_id, entry in relation.items() if entry['title']}
+    options['db_tags'] = sorted(set(options['db_tag_titles'].values()))
+    return options, relation_db_id, relation
+
+def get_filter_options(notion, database_id, use_cache=True, metrics=None, rate_share=None):
+    """データベースからフィルタオプションを取得（失敗時は例外を送出）
+    
+    スキーマ（カテゴリなどの選択肢）は1リクエストなので毎回取得し、追加された選択肢がすぐに表れる。
+    リレーション先のタイトルの対応は、有効期限内なら前回から更新されたページだけを反映し、
+    期限切れ（またはuse_cacheがFalse）なら削除されたページを除くために全件取得し直す。
+    db_tag_titlesにはリレーション先のページID→タイトルの対応が入る（build_filter_queryでIDに変換する）。
+    rate_shareを指定すると、レート制限のうちその割合までしか使わない（バックグラウンドの事前取得用）。
+    """
+    cached = load_filter_options_cache(database_id) if use_cache else None
+    relation_fetched_at = cached.get('relation_fetched_at') if cached else None
+    if relation_fetched_at is None or time.time() - relation_fetched_at >= FILTER_OPTIONS_TTL_SEC:
+        cached = None
+        relation_fetched_at = time.time()
+    
+    options, relation_db_id, relation = run_with_fetcher(
+        notion, fetch_filter_options, database_id, cached, metrics=metrics, rate_share=rate_share
+    )
+    save_filter_options_cache(database_id, options, relation_db_id, relation, relation_fetched_at)
+    return options
+
+def build_filter_query(selected_categories, selected_db_tags, db_tag_titles=None):
+    """Notion APIフィルタクエリを構築
+    
+    db_tag_titles（リレーション先のページID→タイトル）を渡すと、DB_tagのタイトルを
+    relation.containsが受け付けるページIDに変換する（対応がなければそのまま送る）。
+    """
+    filters = []
+    
+    if selected_categories:
+        if len(selected_categories) == 1:
+            filters.append({
+                "property": "カテゴリ",
+                "select": {"equals": selected_categories[0]}
+            })
+        else:
+            category_filters = [
+                {"property": "カテゴリ", "select": {"equals": cat}}
+                for cat in selected_categories
+            ]
+            filters.append({"or": category_filters})
+    
+    if selected_db_tags:
+        ids_by_title = {}
+        for page_id, title in (db_tag_titles or {}).items():
+            ids_by_title.setdefault(title, []).append(page_id)
+        tag_ids = [page_id for tag in selected_db_tags for page_id in ids_by_title.get(tag, [tag])]
+        
+        if len(tag_ids) == 1:
+            filters.append({
+                "property": "DB_tag",
+                "relation": {"contains": tag_ids[0]}
+            })
+        else:
+            tag_filters = [
+                {"property": "DB_tag", "relation": {"contains": tag_id}}
+                for tag_id in tag_ids
+            ]
+            filters.append({"or": tag_filters})
+    
+    if len(filters) == 0:
+        return None
+    elif len(filters) == 1:
+        return filters[0]
+    else:
+        return {"and": filters}
+
+def merge_filter_options(options_list):
+    """複数のデータベースのフィルタオプションを1つにまとめる（選択肢は出現順に重複を除く）"""
+    merged = {'categories': [], 'db_tags': [], 'db_tag_titles': {}}
+    for options in options_list:
+        for key in ('categories', 'db_tags'):
+            merged[key].extend(name for name in options[key] if name not in merged[key])
+        merged['db_tag_titles'].update(options.get('db_tag_titles', {}))
+    return merged
+
+def build_database_filters(database_ids, selected_categories, selected_db_tags, filter_options_by_db=None):
+    """データベースごとのフィルタクエリを構築し、(データベースID, フィルタ) のリストを返す
+    
+    フィルタオプションが分かっているデータベースには、そのデータベースにある選択肢だけで絞り込む。
+    選んだ条件の選択肢を1つも持たないデータベースは、一致するページがないので読み込まない。
+    """
+    sources = []
+    for database_id in database_ids:
+        options = (filter_options_by_db or {}).get(database_id)
+        if options is None:
+            sources.append((database_id, build_filter_query(selected_categories, selected_db_tags)))
+            continue
+        
+        categories = [name for name in selected_categories if name in options['categories']]
+        db_tags = [
+            name for name in selected_db_tags
+            if name in options['db_tags'] or name in options.get('db_tag_titles', {})
+        ]
+        if (selected_categories and not categories) or (selected_db_tags and not db_tags):
+            continue
+        sources.append((database_id, build_filter_query(categories, db_tags, options.get('db_tag_titles'))))
+    return sources
+
+async def query_database_pages(fetcher, database_id, filter_query=None):
+    """データベースをクエリしてページオブジェクトを全件取得"""
+    query_params = {"database_id": database_id}
+    if filter_query:
+        query_params["filter"] = filter_query
+    
+    with fetcher.metrics.stage('query'):
+        return await fetcher.paginate(fetcher.client.databases.query, **query_params)
+
+async def get_page_content_shared(fetcher, page, max_depth=0, synced=None, reuse_blocks=True, markdown=False):
+    """ページ本文を取得（同じ版のページをプロセス内の別の読み込みが取得中なら、その結果を待って使う）"""
+    # 全件再取得ではブロックストアを使った取得の結果を待たない
+    key = (page['id'], page.get('last_edited_time'), max_depth, reuse_blocks, markdown)
+    while True:
+        with _inflight_pages_lock:
+            future = _inflight_pages.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = _inflight_pages[key] = concurrent.futures.Future()
+        if is_owner:
+            break
+        
+        try:
+            # 待っている側が中断されても、取得している側のFutureは取り消さない
+            with fetcher.metrics.stage('shared_wait'):
+                page_content = await asyncio.shield(asyncio.wrap_future(future))
+        except FetchCancelled:
+            # 取得していた読み込みが中断されたので、こちらで取得し直す
+            continue
+        # 呼び出し元でdatabase_idなどを書き換えるので、取得した側とは別の辞書にする
+        return dict(page_content)
+    
+    try:
+        page_content = await get_page_content(fetcher, page, max_depth, synced, reuse_blocks, markdown)
+        future.set_result(page_content)
+        return page_content
+    except BaseException as e:
+        future.set_exception(e if isinstance(e, Exception) else FetchCancelled("ページの取得が中断されました"))
+        raise
+    finally:
+        with _inflight_pages_lock:
+            _inflight_pages.pop(key, None)
+
+async def fetch_pages_async(fetcher, pages, max_depth=0, on_result=None, scheduler=None, reuse_blocks=True,
+                            markdown=False):
+    """ページ本文を非同期に並列取得し、1ページごとに (page_id, page_content, error) を通知
+    
+    取得順はschedulerの優先度に従い、scheduler.cancel() で中断すると実行中のページは通知しない。
+    reuse_blocksがFalseなら、ブロックストアの子孫を使わずにすべて取得し直す。
+    """
+    scheduler = scheduler or FetchScheduler()
+    scheduler.push(pages)
+    # 複数のページにある同じ同期ブロックの中身は、この読み込みの間で1回だけ取得する
+    synced = {}
+    # 優先するページの取得が終わったか優先度が変わったときに、HOLDで待っているタスクを起こす
+    changed = asyncio.Event()
+    
+    async def worker():
+        # 中断されたら未着手のページは取得しない
+        while True:
+            page = scheduler.pop()
+            if page is None:
+                break
+            if page is HOLD:
+                changed.clear()
+                await changed.wait()
+                continue
+            try:
+                result = (page['id'], await get_page_content_shared(
+                    fetcher, page, max_depth, synced, reuse_blocks, markdown
+                ), None)
+            except Exception as e:
+                result = (page['id'], None, e)
+            finally:
+                scheduler.finish(page['id'])
+            if on_result:
+                on_result(result)
+    
+    tasks = [asyncio.ensure_future(worker()) for _ in range(min(PAGE_WORKERS, len(pages)))]
+    scheduler.attach(asyncio.get_running_loop(), tasks, changed.set)
+    # 中断されたタスクは例外を送出せずに終わらせる
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def iter_fetch_pages(notion, pages, max_depth=0, metrics=None, rate_share=None, scheduler=None,
+                     reuse_blocks=True, markdown=False):
+    """クエリ結果のページの本文を取得できた順に返すジェネレータ（取得したページは返す前にストアに保存）
+    
+    schedulerを渡すと、その優先度の順に取得し、scheduler.cancel() で残りの取得を中断できる。
+    reuse_blocksがFalse（全件再取得）なら、ブロックストアの子孫を使わずにすべて取得し直す。
+    """
+    if len(pages) == 0:
+        return
+    
+    metrics = metrics or Metrics()
+    scheduler = scheduler or FetchScheduler()
+    results = queue.Queue()
+    
+    def save_result(result):
+        # 読み込みが中断されても取得済みのページは次回再利用できるよう即座に保存
+        # （他のプロセスの書き込みを待つことがあるので、取得中のイベントループではなくこのスレッドで書き込む）
+        page_id, page_content, error = result
+        if page_content:
+            with metrics.stage('cache_write'):
+                save_page_to_store(page_content)
+    
+    def worker():
+        try:
+            run_with_fetcher(
+                notion, fetch_pages_async, pages, max_depth, results.put, scheduler, reuse_blocks, markdown,
+                metrics=metrics, rate_share=rate_share
+            )
+        except Exception as e:
+            results.put((None, None, e))
+        finally:
+            results.put(None)
+    
+    threading.Thread(target=worker, daemon=True).start()
+    
+    try:
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            save_result(result)
+            yield result
+    except GeneratorExit:
+        # 途中で閉じられたら（画面の再実行など）残りは取得せず、受け取り済みのページだけ保存する
+        scheduler.cancel()
+        while True:
+            try:
+                result = results.get_nowait()
+            except queue.Empty:
+                break
+            if result is not None:
+                save_result(result)
+        raise
+
+def load_pages_from_store(page_refs, max_depth=0, metrics=None, markdown=False):
+    """ページ一覧に対応する本文をストアからまとめて読み込み（欠けがあればNone）"""
+    metrics = metrics or Metrics()
+    pages_data = []
+    for ref in page_refs:
+        with metrics.stage('cache_read'):
+            page_content = load_page_from_store(ref['id'], ref.get('last_edited_time'), max_depth, markdown)
+        metrics.record_cache(page_content is not None)
+        if page_content is None:
+            return None
+        pages_data.append(page_content)
+    return pages_data
+
+def iter_database_pages(notion, database_id, filter_query=None, use_cache=True, incremental=False,
+                        max_depth=0, report=None, metrics=None, markdown=False):
+    """データベースのページを取得できた順に返すジェネレータ（差分更新・途中再開対応）
+    
+    reportには件数や取得できなかったページなど、読み込み結果の集計が書き込まれる。
+    metricsを渡すと、APIリクエストや処理段階ごとの計測値がそこに集計される。
+    """
+    return iter_databases_pages(
+        notion, [(database_id, filter_query)], use_cache, incremental, max_depth, report, metrics,
+        markdown=markdown
+    )
+
+async def query_databases_pages(fetcher, sources):
+    """複数のデータベースを同時にクエリ（失敗したデータベースは例外をそのまま結果に入れる）"""
+    return await asyncio.gather(*[
+        query_database_pages(fetcher, database_id, filter_query)
+        for database_id, filter_query in sources
+    ], return_exceptions=True)
+
+def iter_databases_pages(notion, sources, use_cache=True, incremental=False, max_depth=0,
+                         report=None, metrics=None, rate_share=None, scheduler=None, markdown=False):
+    """複数のデータベース（(データベースID, フィルタ) のリスト）のページを取得できた順に返すジェネレータ
+    
+    クエリも本文の取得も全データベース分をまとめて1つのフェッチャーで行うため、
+    レート制限とHTTP接続は全データベースで共有される。ページ一覧はデータベースごとにキャッシュし、
+    各ページの database_id には読み込み元のデータベースIDを入れる。
+    すべてのデータベースのクエリに失敗したときだけ例外を送出し、一部の失敗はreportのfailedに入れる。
+    rate_shareを指定すると、レート制限のうちその割合までしか使わない（バックグラウンドの事前取得用）。
+    schedulerを渡すと、本文はその優先度の順に取得し、scheduler.cancel() で残りの取得を中断できる。
+    markdownなら本文の装飾をMarkdownで出力する（キャッシュは描画方法ごとに別に持つ）。
+    """
+    if report is None:
+        report = {}
+    metrics = metrics or Metrics()
+    scheduler = scheduler or FetchScheduler()
+    report.update({
+        'cache_time': None,
+        'incremental': incremental,
+        'order': [],
+        'reused': 0,
+        'refetched': 0,
+        'removed': 0,
+        'failed': []
+    })
+    seen = set()
+    
+    def add_to_order(page_id):
+        # 複数のデータベース（またはフィルタ）に同じページがあれば最初の1つだけを使う
+        if page_id in seen:
+            return False
+        seen.add(page_id)
+        report['order'].append(page_id)
+        return True
+    
+    cached_by_source = {}
+    cache_times = []
+    sources_to_query = []
+    for database_id, filter_query in sources:
+        cached = None
+        if use_cache or incremental:
+            with metrics.stage('cache_read'):
+                cached = load_cache(database_id, filter_query)
+        
+        if use_cache and not incremental and cached:
+            # スナップショットがあれば本文を展開せずに返す（本文は使うときに読み込まれる）
+            with metrics.stage('cache_read'):
+                snapshot = open_snapshot(database_id, filter_query, max_depth, cached['data'], markdown)
+            if snapshot is not None:
+                cache_times.append(cached['timestamp'])
+                for record in snapshot.records(database_id):
+                    metrics.record_cache(True)
+                    if add_to_order(record.id):
+                        yield record
+                continue
+            
+            pages_data = load_pages_from_store(cached['data'], max_depth, metrics, markdown)
+            if pages_data is not None:
+                cache_times.append(cached['timestamp'])
+                with metrics.stage('snapshot_write'):
+                    write_snapshot(database_id, filter_query, max_depth, pages_data, markdown)
+                for page in pages_data:
+                    if add_to_order(page['id']):
+                        page['database_id'] = database_id
+                        yield page
+                continue
+            # ストアに欠けているページがあれば（前回の中断など）差分更新で補う
+            report['incremental'] = True
+        
+        cached_by_source[len(sources_to_query)] = cached
+        sources_to_query.append((database_id, filter_query))
+    
+    if not sources_to_query:
+        report['cache_time'] = min(cache_times) if cache_times else None
+        schedule_access_flush()
+        return
+    
+    results = run_with_fetcher(
+        notion, query_databases_pages, sources_to_query, metrics=metrics, rate_share=rate_share
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if len(errors) == len(results) and not cache_times:
+        raise errors[0]
+    
+    source_by_page = {}
+    pages_to_fetch = []
+    # 次回の起動用に、データベースごとのスナップショットを読み込みながら書き出す（(書き出し, ページID) のリスト）
+    snapshot_writers = []
+    try:
+        for index, ((database_id, filter_query), pages) in enumerate(zip(sources_to_query, results)):
+            if isinstance(pages, Exception):
+                report['failed'].append({'id': database_id, 'error': str(pages)})
+                continue
+            
+            cached = cached_by_source[index]
+            if report['incremental'] and cached:
+                report['removed'] += len({ref['id'] for ref in cached['data']} - {page['id'] for page in pages})
+            
+            # ページ一覧を先に保存しておき、中断されても次回はストアにない分だけ取得する
+            with metrics.stage('cache_write'):
+                save_cache(database_id, filter_query, pages)
+            writer = SnapshotWriter(database_id, filter_query, max_depth, markdown)
+            snapshot_writers.append((writer, [page['id'] for page in pages]))
+            
+            # 全件再取得でなければ、ページストアにある本文を再利用する
+            for page in pages:
+                if not add_to_order(page['id']):
+                    continue
+                stored_page = None
+                if use_cache or report['incremental']:
+                    with metrics.stage('cache_read'):
+                        stored_page = load_page_from_store(
+                            page['id'], page.get('last_edited_time'), max_depth, markdown
+                        )
+                    metrics.record_cache(stored_page is not None)
+                if stored_page:
+                    # タイトルやタグは最新のクエリ結果で上書きする（以前の形式で保存されたページにも付与される）
+                    stored_page.update(get_page_metadata(page))
+                    stored_page['database_id'] = database_id
+                    writer.add(stored_page)
+                    report['reused'] += 1
+                    yield stored_page
+                else:
+                    source_by_page[page['id']] = writer
+                    pages_to_fetch.append(page)
+        
+        report['refetched'] = len(pages_to_fetch)
+        for page_id, page_content, error in iter_fetch_pages(
+            notion, pages_to_fetch, max_depth, metrics, rate_share, scheduler,
+            reuse_blocks=use_cache or report['incremental'], markdown=markdown
+        ):
+            if error is not None:
+                report['failed'].append({'id': page_id, 'error': str(error)})
+            else:
+                writer = source_by_page[page_id]
+                page_content['database_id'] = writer.database_id
+                writer.add(page_content)
+                yield page_content
+        
+        # 取得できなかったページがあるデータベースは、一覧と揃わないので書き出さない
+        with metrics.stage('snapshot_write'):
+            for writer, page_ids in snapshot_writers:
+                writer.finish(page_ids)
+    finally:
+        # 途中で中断された場合は書きかけの一時ファイルを消す
+        for writer, _ in snapshot_writers:
+            writer.discard()
+        schedule_access_flush()
+
+def schedule_access_flush():
+    """読み込んだページ・ブロックの最後に使われた時刻を、別のスレッドでまとめて書き込む
+    
+    他のプロセスが書き込み中でも、キャッシュからの読み込みを書き込みの順番待ちで遅らせない。
+    """
+    threading.Thread(target=flush_access_times, daemon=True).start()
+
+def write_snapshot(database_id, filter_query, max_depth, pages_data, markdown=False):
+    """ページストアから読み込んだページでスナップショットを作る（次回からは本文を展開せずに開ける）"""
+    writer = SnapshotWriter(database_id, filter_query, max_depth, markdown)
+    for page in pages_data:
+        writer.add(page)
+    return writer.finish([page['id'] for page in pages_data])
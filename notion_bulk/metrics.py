@@ -0,0 +1,208 @@
+"""読み込み処理の計測（APIリクエスト数・レイテンシ・待ち時間・処理段階ごとの時間）"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# APIレイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def get_endpoint_name(method):
+    """notion-clientのメソッドから 'blocks.children.list' のようなエンドポイント名を得る"""
+    endpoint = getattr(method, '__self__', None)
+    if endpoint is None:
+        return getattr(method, '__name__', 'unknown')
+    resource = type(endpoint).__name__.replace('Endpoint', '')
+    return f"{re.sub(r'(?<!^)(?=[A-Z])', '.', resource).lower()}.{method.__name__}"
+
+class Histogram:
+    """累積バケット形式のヒストグラム（Prometheusと同じ形式）"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+    
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'mean': round(self.sum / self.count, 4) if self.count else None,
+            'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        }
+
+class Metrics:
+    """1回の読み込み（またはCLIの1回の実行）で集計する計測値"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.api_calls = Counter()
+        self.api_errors = Counter()
+        self.api_latency = {}
+        self.retries = Counter()
+        self.throttled_seconds = 0.0
+        self.bytes_received = 0
+        self.stage_seconds = Counter()
+        self.stage_counts = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.block_cache_hits = 0
+        self.block_cache_misses = 0
+    
+    def record_api(self, endpoint, seconds, status=200):
+        """APIリクエスト1回分のレイテンシと結果を記録"""
+        with self.lock:
+            self.api_calls[endpoint] += 1
+            if status >= 400:
+                self.api_errors[f"{endpoint} {status}"] += 1
+            self.api_latency.setdefault(endpoint, Histogram()).observe(seconds)
+    
+    def record_retry(self, endpoint, wait_seconds, throttled):
+        """リトライとその待ち時間を記録（429・5xxによる待ちは抑制時間として集計）"""
+        with self.lock:
+            self.retries[endpoint] += 1
+            if throttled:
+                self.throttled_seconds += wait_seconds
+    
+    def record_bytes(self, size):
+        with self.lock:
+            self.bytes_received += size
+    
+    def record_cache(self, hit):
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+    
+    def record_block_cache(self, hits, misses):
+        """更新されたページのトップレベルのブロックのうち、ブロックストアを再利用できた数とできなかった数"""
+        with self.lock:
+            self.block_cache_hits += hits
+            self.block_cache_misses += misses
+    
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stage_seconds[name] += seconds
+            self.stage_counts[name] += 1
+    
+    @contextmanager
+    def stage(self, name):
+        """with文の中の処理時間を段階ごとに集計"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+    
+    @property
+    def cache_hit_ratio(self):
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else None
+    
+    def to_dict(self):
+        """JSONに書き出せる辞書に変換"""
+        with self.lock:
+            return {
+                'api_calls': dict(self.api_calls),
+                'api_errors': dict(self.api_errors),
+                'api_latency_seconds': {
+                    endpoint: histogram.to_dict() for endpoint, histogram in self.api_latency.items()
+                },
+                'retries': dict(self.retries),
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'bytes_received': self.bytes_received,
+                'stage_seconds': {name: round(seconds, 4) for name, seconds in self.stage_seconds.items()},
+                'stage_counts': dict(self.stage_counts),
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+                'cache_hit_ratio': self.cache_hit_ratio,
+                'block_cache_hits': self.block_cache_hits,
+                'block_cache_misses': self.block_cache_misses
+            }
+    
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+    
+    def to_prometheus(self):
+        """Prometheusのテキスト形式に変換"""
+        with self.lock:
+            lines = [
+                "# HELP notion_api_requests_total Notion API requests by endpoint.",
+                "# TYPE notion_api_requests_total counter"
+            ]
+            for endpoint, count in sorted(self.api_calls.items()):
+                lines.append(f'notion_api_requests_total{{endpoint="{endpoint}"}} {count}')
+            
+            lines += [
+                "# HELP notion_api_errors_total Notion API error responses by endpoint and status.",
+                "# TYPE notion_api_errors_total counter"
+            ]
+            for key, count in sorted(self.api_errors.items()):
+                endpoint, status = key.rsplit(" ", 1)
+                lines.append(f'notion_api_errors_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+            
+            lines += [
+                "# HELP notion_api_request_duration_seconds Notion API request latency.",
+                "# TYPE notion_api_request_duration_seconds histogram"
+            ]
+            for endpoint, histogram in sorted(self.api_latency.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(
+                        f'notion_api_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'notion_api_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}'
+                )
+                lines.append(f'notion_api_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+                lines.append(f'notion_api_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+            
+            lines += [
+                "# HELP notion_api_retries_total Retried Notion API requests by endpoint.",
+                "# TYPE notion_api_retries_total counter"
+            ]
+            for endpoint, count in sorted(self.retries.items()):
+                lines.append(f'notion_api_retries_total{{endpoint="{endpoint}"}} {count}')
+            
+            lines += [
+                "# HELP notion_api_throttled_seconds_total Time spent backing off after 429/5xx responses.",
+                "# TYPE notion_api_throttled_seconds_total counter",
+                f"notion_api_throttled_seconds_total {self.throttled_seconds:.6f}",
+                "# HELP notion_api_received_bytes_total Response bytes received from the Notion API.",
+                "# TYPE notion_api_received_bytes_total counter",
+                f"notion_api_received_bytes_total {self.bytes_received}",
+                "# HELP notion_stage_seconds_total Time spent per loading stage.",
+                "# TYPE notion_stage_seconds_total counter"
+            ]
+            for name, seconds in sorted(self.stage_seconds.items()):
+                lines.append(f'notion_stage_seconds_total{{stage="{name}"}} {seconds:.6f}')
+            
+            lines += [
+                "# HELP notion_cache_requests_total Page store lookups by result.",
+                "# TYPE notion_cache_requests_total counter",
+                f'notion_cache_requests_total{{result="hit"}} {self.cache_hits}',
+                f'notion_cache_requests_total{{result="miss"}} {self.cache_misses}',
+                "# HELP notion_block_cache_requests_total Block store lookups for edited pages by result.",
+                "# TYPE notion_block_cache_requests_total counter",
+                f'notion_block_cache_requests_total{{result="hit"}} {self.block_cache_hits}',
+                f'notion_block_cache_requests_total{{result="miss"}} {self.block_cache_misses}'
+            ]
+            return "\n".join(lines) + "\n"
+    
+    def write(self, path):
+        """拡張子が .prom / .txt ならPrometheus形式、それ以外はJSONで書き出す"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith(('.prom', '.txt')):
+                f.write(self.to_prometheus())
+            else:
+                f.write(self.to_json() + "\n")
@@ -0,0 +1,332 @@
+"""Notion APIの代わりに合成データを返すローカルHTTPサーバー（ベンチマーク・オフライン確認用）
+
+    with MockNotionServer(latency_ms=50, rate_limit_ratio=0.05) as server:
+        server.add_database("bench-db", page_count=500, depth=2)
+        notion = Client(auth="mock", base_url=server.url)
+
+ページやブロックは要求されたときにIDから決定的に生成するため、大きなデータベースでもメモリを使わない。
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 本文の生成に使う単語（日本語と英語を混ぜる）
+MOCK_WORDS = [
+    "Notion", "API", "データベース", "ページ", "仕様", "設計", "レビュー", "テスト", "リリース",
+    "キャッシュ", "検索", "インデックス", "東京", "大阪", "会議", "議事録", "タスク", "進捗",
+    "cache", "search", "index", "release", "design", "review", "meeting", "task", "sync"
+]
+# 生成するブロックの種類（子ブロックを持てるものは後ろの3つ）
+MOCK_BLOCK_TYPES = [
+    "paragraph", "heading_2", "numbered_list_item", "code", "quote",
+    "toggle", "bulleted_list_item", "callout"
+]
+MOCK_PARENT_BLOCK_TYPES = {"toggle", "bulleted_list_item", "callout"}
+MOCK_CATEGORIES = ["仕様", "議事録", "設計", "その他"]
+MOCK_TAGS = ["frontend", "backend", "infra", "docs"]
+# ページネーションの既定件数（Notion APIと同じ）
+MOCK_PAGE_SIZE = 100
+
+# ページID（<DB ID>-p<連番>）と、その後ろに .<番号> を階層の数だけ付けたブロックID
+OBJECT_ID_PATTERN = re.compile(r"(.+)-p(\d{6})((?:\.\d+)*)")
+
+def split_object_id(object_id):
+    """ページIDやブロックIDを (データベースID, ページID, 階層の深さ) に分解"""
+    match = OBJECT_ID_PATTERN.fullmatch(object_id)
+    if not match:
+        raise KeyError(object_id)
+    database_id, number, path = match.groups()
+    return database_id, f"{database_id}-p{number}", path.count(".")
+
+def rich_text(text):
+    """plain_textだけを持つrich_text配列を生成"""
+    return [{"type": "text", "text": {"content": text}, "plain_text": text, "annotations": {}}]
+
+class MockDatabase:
+    """合成データベースの設定とページの版（更新・削除）を保持"""
+    
+    def __init__(self, database_id, page_count, blocks_per_page, depth, children_per_block):
+        self.database_id = database_id
+        self.blocks_per_page = blocks_per_page
+        self.depth = depth
+        self.children_per_block = children_per_block
+        self.page_ids = [f"{database_id}-p{index:06d}" for index in range(page_count)]
+        self.versions = {}
+        # ブロックID → 版（touch_blockで更新したブロック）
+        self.block_versions = {}
+        # ページID → ページ全体を更新した時刻、ページ・ブロックID → 最後に編集された時刻
+        self.touched_at = {}
+        self.edited_at = {}
+        self.deleted = set()
+
+class MockNotionServer:
+    """合成データベースを配信するNotion API互換のローカルサーバー"""
+    
+    def __init__(self, latency_ms=0, rate_limit_ratio=0.0, retry_after=1, seed=0):
+        self.latency_ms = latency_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.seed = seed
+        self.databases = {}
+        self.counts = Counter()
+        # 更新のたびに1秒ずつ進む時計（Notionと同じく、ページの更新日時は最後の編集の時刻になる）
+        self.clock = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.server = None
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+    
+    def add_database(self, database_id, page_count, blocks_per_page=10, depth=0, children_per_block=3):
+        """合成データベースを追加"""
+        database = MockDatabase(database_id, page_count, blocks_per_page, depth, children_per_block)
+        self.databases[database_id] = database
+        return database
+    
+    def touch(self, page_id):
+        """ページを更新したことにする（last_edited_timeと本文が変わる）"""
+        database = self.find_database(page_id)
+        database.versions[page_id] = database.versions.get(page_id, 0) + 1
+        database.touched_at[page_id] = database.edited_at[page_id] = self.tick()
+    
+    def touch_block(self, block_id):
+        """1つのブロックだけを更新したことにする（そのブロックとページのlast_edited_timeが変わる）
+        
+        Notionと同じく、子孫のブロックを編集しても親のブロックの更新日時は変わらない。
+        """
+        database = self.find_database(block_id)
+        database.block_versions[block_id] = database.block_versions.get(block_id, 0) + 1
+        database.edited_at[block_id] = database.edited_at[split_object_id(block_id)[1]] = self.tick()
+    
+    def tick(self):
+        with self.lock:
+            self.clock += 1
+            return self.clock
+    
+    def delete(self, page_id):
+        """ページを削除したことにする"""
+        self.find_database(page_id).deleted.add(page_id)
+    
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+            self.bytes_sent = 0
+    
+    def start(self):
+        """バックグラウンドスレッドでサーバーを起動"""
+        mock = self
+        
+        class Handler(MockRequestHandler):
+            server_mock = mock
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+    
+    def find_database(self, object_id):
+        """ページIDやブロックIDから所属するデータベースを探す"""
+        return self.databases[split_object_id(object_id)[0]]
+    
+    def seeded_random(self, object_id, version=0):
+        """オブジェクトIDごとに決定的な乱数を返す"""
+        return random.Random(zlib.crc32(f"{self.seed}:{object_id}:{version}".encode()))
+    
+    def edited_time(self, clock):
+        return f"2024-01-01T00:{clock // 60:02d}:{clock % 60:02d}.000Z"
+    
+    def build_page(self, database, page_id):
+        """ページオブジェクトを生成"""
+        rng = self.seeded_random(page_id)
+        title = " ".join(rng.choice(MOCK_WORDS) for _ in range(3))
+        return {
+            "object": "page",
+            "id": page_id,
+            "last_edited_time": self.edited_time(database.edited_at.get(page_id, 0)),
+            "parent": {"type": "database_id", "database_id": database.database_id},
+            "properties": {
+                "名前": {"id": "title", "type": "title", "title": rich_text(f"{title} {page_id[-6:]}")},
+                "カテゴリ": {"id": "cat", "type": "select", "select": {"name": rng.choice(MOCK_CATEGORIES)}},
+                "DB_tag": {"id": "tag", "type": "multi_select", "multi_select": [
+                    {"name": tag} for tag in rng.sample(MOCK_TAGS, 2)
+                ]}
+            }
+        }
+    
+    def build_blocks(self, database, parent_id):
+        """ページまたはブロックの子ブロックを生成（IDの階層から深さを判断）"""
+        database_id, page_id, depth = split_object_id(parent_id)
+        version = database.versions.get(page_id, 0)
+        count = database.blocks_per_page if depth == 0 else database.children_per_block
+        rng = self.seeded_random(parent_id, version)
+        
+        blocks = []
+        for index in range(count):
+            block_id = f"{parent_id}.{index}"
+            block_type = rng.choice(MOCK_BLOCK_TYPES)
+            text = " ".join(rng.choice(MOCK_WORDS) for _ in range(rng.randint(5, 30)))
+            if version:
+                text += f" (v{version})"
+            block_version = database.block_versions.get(block_id, 0)
+            if block_version:
+                text += f" (b{block_version})"
+            payload = {"rich_text": rich_text(text)}
+            if block_type == "code":
+                payload["language"] = "python"
+            blocks.append({
+                "object": "block",
+                "id": block_id,
+                "type": block_type,
+                "last_edited_time": self.edited_time(
+                    max(database.touched_at.get(page_id, 0), database.edited_at.get(block_id, 0))
+                ),
+                "has_children": block_type in MOCK_PARENT_BLOCK_TYPES and depth < database.depth,
+                block_type: payload
+            })
+        return blocks
+    
+    def build_database(self, database):
+        return {
+            "object": "database",
+            "id": database.database_id,
+            "title": rich_text(database.database_id),
+            "last_edited_time": self.edited_time(0),
+            "properties": {
+                "名前": {"id": "title", "type": "title", "title": {}},
+                "カテゴリ": {"id": "cat", "type": "select", "select": {
+                    "options": [{"name": name} for name in MOCK_CATEGORIES]
+                }},
+                "DB_tag": {"id": "tag", "type": "multi_select", "multi_select": {
+                    "options": [{"name": name} for name in MOCK_TAGS]
+                }}
+            }
+        }
+    
+    def paginate(self, items, start_cursor, page_size):
+        start = int(start_cursor) if start_cursor else 0
+        end = start + min(page_size or MOCK_PAGE_SIZE, MOCK_PAGE_SIZE)
+        has_more = end < len(items)
+        return {
+            "object": "list",
+            "results": items[start:end],
+            "has_more": has_more,
+            "next_cursor": str(end) if has_more else None
+        }
+    
+    def handle(self, method, path, query, body):
+        """リクエストを処理して (ステータス, 本文, 追加ヘッダー) を返す"""
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        
+        with self.lock:
+            throttled = self.rate_limit_ratio and self.random.random() < self.rate_limit_ratio
+        if throttled:
+            self.count("rate_limited")
+            return 429, {
+                "object": "error", "status": 429, "code": "rate_limited",
+                "message": "You have been rate limited. Please try again in a few minutes."
+            }, {"Retry-After": str(self.retry_after)}
+        
+        try:
+            match = re.fullmatch(r"/v1/databases/([^/]+)/query", path)
+            if match and method == "POST":
+                self.count("databases.query")
+                database = self.databases[match.group(1)]
+                pages = [
+                    self.build_page(database, page_id)
+                    for page_id in database.page_ids if page_id not in database.deleted
+                ]
+                return 200, self.paginate(pages, body.get("start_cursor"), body.get("page_size")), {}
+            
+            match = re.fullmatch(r"/v1/databases/([^/]+)", path)
+            if match:
+                self.count("databases.retrieve")
+                return 200, self.build_database(self.databases[match.group(1)]), {}
+            
+            match = re.fullmatch(r"/v1/pages/([^/]+)", path)
+            if match:
+                self.count("pages.retrieve")
+                database = self.find_database(match.group(1))
+                if match.group(1) in database.deleted or match.group(1) not in database.page_ids:
+                    raise KeyError(match.group(1))
+                return 200, self.build_page(database, match.group(1)), {}
+            
+            match = re.fullmatch(r"/v1/blocks/([^/]+)/children", path)
+            if match:
+                self.count("blocks.children.list")
+                blocks = self.build_blocks(self.find_database(match.group(1)), match.group(1))
+                page_size = int(query.get("page_size", [MOCK_PAGE_SIZE])[0])
+                return 200, self.paginate(blocks, query.get("start_cursor", [None])[0], page_size), {}
+        except KeyError:
+            pass
+        
+        self.count("not_found")
+        return 404, {
+            "object": "error", "status": 404, "code": "object_not_found",
+            "message": f"Could not find object: {path}"
+        }, {}
+    
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """MockNotionServer にリクエストを渡すHTTPハンドラ"""
+    
+    protocol_version = "HTTP/1.1"
+    server_mock = None
+    
+    def do_GET(self):
+        self.dispatch()
+    
+    def do_POST(self):
+        self.dispatch()
+    
+    def dispatch(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        
+        status, payload, headers = self.server_mock.handle(self.command, url.path, parse_qs(url.query), body)
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # 読み込みが中断されてクライアントが接続を閉じた
+            return
+        with self.server_mock.lock:
+            self.server_mock.bytes_sent += len(data)
+    
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,129 @@
+"""一覧に保持するページのコンパクトな表現
+
+画面のセッション状態には本文を持たないPageRecordだけを置き、本文はプロセス全体で共有する
+キャッシュ（足りなければディスクのページストア）から、プレビューや書き出しのときに読み込む。
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from .cache import load_page_from_store
+
+# プロセス全体で共有する本文キャッシュの上限（文字数）
+CONTENT_CACHE_MAX_CHARS = 32_000_000
+# 一覧に表示する本文のプレビューの文字数
+PREVIEW_CHARS = 100
+
+class ContentCache:
+    """(ページID, 最終更新日時, 取得深さ, Markdownか) → 本文 のLRUキャッシュ（スレッドセーフ）"""
+    
+    def __init__(self, max_chars=CONTENT_CACHE_MAX_CHARS):
+        self.max_chars = max_chars
+        self.chars = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            content = self.entries.get(key)
+            if content is not None:
+                self.entries.move_to_end(key)
+            return content
+    
+    def put(self, key, content):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.chars -= len(previous)
+            self.entries[key] = content
+            self.chars += len(content)
+            while self.chars > self.max_chars and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.chars -= len(evicted)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.chars = 0
+
+# Streamlitの全セッションで共有される
+content_cache = ContentCache()
+
+class PageContentUnavailable(LookupError):
+    """一覧のページの本文がキャッシュにもページストアにも残っていない（読み込み直すと再取得される）"""
+
+class PageRecord:
+    """本文を持たないページ情報（page['title'] や page.get('tags') のように辞書と同じ形で読める）"""
+    
+    # snapshotはスナップショットから作った場合の本文の読み込み元（snapshot_index番目のページ）
+    __slots__ = (
+        'id', 'database_id', 'title', 'category', 'tags', 'last_edited_time', 'char_count',
+        'line_count', 'max_depth', 'markdown', 'preview', 'snapshot', 'snapshot_index'
+    )
+    
+    def __init__(self, id, title, char_count, line_count, database_id=None, category='', tags=(),
+                 last_edited_time=None, max_depth=0, markdown=False, preview='', snapshot=None,
+                 snapshot_index=None):
+        self.id = id
+        # 多くのページで同じ値になる文字列は1つにまとめる
+        self.database_id = sys.intern(database_id) if database_id else database_id
+        self.title = title
+        self.category = sys.intern(category)
+        self.tags = tuple(sys.intern(tag) for tag in tags)
+        self.last_edited_time = last_edited_time
+        self.char_count = char_count
+        self.line_count = line_count
+        self.max_depth = max_depth
+        self.markdown = markdown
+        # 一覧に表示する本文の先頭（表示のたびに本文を読み込まない）
+        self.preview = preview
+        self.snapshot = snapshot
+        self.snapshot_index = snapshot_index
+    
+    @classmethod
+    def from_page(cls, page):
+        """読み込んだページの辞書から作成し、本文は共有キャッシュに入れる"""
+        record = cls(
+            page['id'], page['title'], page['char_count'], page['line_count'],
+            database_id=page.get('database_id'),
+            category=page.get('category', ''),
+            tags=page.get('tags', ()),
+            last_edited_time=page.get('last_edited_time'),
+            max_depth=page.get('max_depth', 0),
+            markdown=page.get('markdown', False),
+            preview=page['content'][:PREVIEW_CHARS]
+        )
+        content_cache.put(record.content_key, page['content'])
+        return record
+    
+    @property
+    def content_key(self):
+        return (self.id, self.last_edited_time, self.max_depth, self.markdown)
+    
+    @property
+    def content(self):
+        """本文（共有キャッシュになければスナップショットかページストアから読み込む）
+        
+        ストアは版ごとに本文を持つので、容量の上限で削除されていなければこのレコードの版が読める。
+        削除されていたら別の版や空文字で代用せずPageContentUnavailableを送出する。
+        """
+        content = content_cache.get(self.content_key)
+        if content is None:
+            if self.snapshot is not None:
+                content = self.snapshot.read_content(self.snapshot_index)
+            else:
+                page = load_page_from_store(self.id, self.last_edited_time, self.max_depth, self.markdown)
+                if page is None:
+                    raise PageContentUnavailable(self.id)
+                content = page['content']
+            content_cache.put(self.content_key, content)
+        return content
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
@@ -0,0 +1,120 @@
+"""ページ本文の取得順と中断を管理するスケジューラー
+
+画面で見ている・選択しているページを先に取得し、残りはクエリ結果の順にバックグラウンドで取得する。
+優先するページの取得中は残りのページに手を付けず、レート制限の枠を優先するページに回す。
+優先度は読み込み中でも別のスレッドから変えられ、cancelで未着手のページの取得と実行中のリクエストを止める。
+
+    scheduler = FetchScheduler(priority_ids=visible_page_ids)
+    pages = iter_databases_pages(notion, sources, scheduler=scheduler)
+    scheduler.prioritize(selected_page_ids)
+    scheduler.cancel()
+"""
+import heapq
+import threading
+
+# 優先度（小さいほど先に取得する）
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 1
+# popが返す「優先するページの取得中なので、どれかが終わるか優先度が変わるまで待つ」印
+HOLD = object()
+
+class FetchScheduler:
+    """取得待ちのページを優先度・クエリ結果の順に取り出すキュー（スレッドセーフ）"""
+    
+    def __init__(self, priority_ids=()):
+        self.lock = threading.Lock()
+        # (優先度, クエリ結果の順, ページID)。優先度を上げたページは入れ直し、古い項目は取り出すときに捨てる
+        self.heap = []
+        self.pending = {}
+        self.order = {}
+        self.priorities = {}
+        # 取得中の優先するページ
+        self.running = set()
+        self.cancelled = threading.Event()
+        self.loop = None
+        self.tasks = []
+        self.on_change = None
+        self.prioritize(priority_ids)
+    
+    def push(self, pages):
+        """取得するページを追加"""
+        with self.lock:
+            for page in pages:
+                page_id = page['id']
+                self.order.setdefault(page_id, len(self.order))
+                self.pending[page_id] = page
+                priority = self.priorities.get(page_id, PRIORITY_BACKGROUND)
+                heapq.heappush(self.heap, (priority, self.order[page_id], page_id))
+    
+    def prioritize(self, page_ids, priority=PRIORITY_VISIBLE):
+        """まだ取得していないページを先に取得する（追加前のページIDを指定してもよい）"""
+        with self.lock:
+            for page_id in page_ids:
+                if priority >= self.priorities.get(page_id, PRIORITY_BACKGROUND):
+                    continue
+                self.priorities[page_id] = priority
+                if page_id in self.pending:
+                    heapq.heappush(self.heap, (priority, self.order[page_id], page_id))
+        self.notify_change()
+    
+    def pop(self):
+        """次に取得するページ（なくなったか中断されたらNone、優先するページの取得中で残りしかなければHOLD）"""
+        with self.lock:
+            while self.heap and not self.cancelled.is_set():
+                priority, _, page_id = self.heap[0]
+                if page_id not in self.pending:
+                    # 優先度を上げる前の古い項目
+                    heapq.heappop(self.heap)
+                    continue
+                if priority >= PRIORITY_BACKGROUND and self.running:
+                    return HOLD
+                heapq.heappop(self.heap)
+                if priority < PRIORITY_BACKGROUND:
+                    self.running.add(page_id)
+                return self.pending.pop(page_id)
+            return None
+    
+    def finish(self, page_id):
+        """popしたページの取得が終わった（失敗・中断も含む）ことを記録"""
+        with self.lock:
+            if page_id not in self.running:
+                return
+            self.running.discard(page_id)
+        self.notify_change()
+    
+    def attach(self, loop, tasks, on_change=None):
+        """取得を実行しているイベントループとタスク（cancelで止める対象）を登録
+        
+        on_changeはHOLDで待っているタスクを起こす関数で、取り出せるページが変わったときにloopで呼ぶ。
+        """
+        with self.lock:
+            self.loop = loop
+            self.tasks = tasks
+            self.on_change = on_change
+        if self.cancelled.is_set():
+            self.cancel()
+    
+    def notify_change(self):
+        with self.lock:
+            loop, on_change = self.loop, self.on_change
+        if loop is None or on_change is None:
+            return
+        try:
+            loop.call_soon_threadsafe(on_change)
+        except RuntimeError:
+            # 取得が終わってイベントループが閉じている
+            pass
+    
+    def cancel(self):
+        """未着手のページは取得せず、実行中のリクエストも中断する"""
+        self.cancelled.set()
+        with self.lock:
+            loop, tasks = self.loop, self.tasks
+        if loop is None:
+            return
+        try:
+            for task in tasks:
+                loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            # 取得が終わってイベントループが閉じている
+            pass
@@ -0,0 +1,157 @@
+"""ページ検索用の転置インデックス"""
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+
+from .cache import load_search_index_state, save_search_index_state
+
+# 検索インデックスでN-gram分割する文字（ひらがな・カタカナ・漢字・ハングル）
+CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(f'[{CJK_CHARS}]+|[^\\W{CJK_CHARS}]+')
+CJK_PATTERN = re.compile(f'[{CJK_CHARS}]')
+
+def normalize_search_text(text):
+    """検索用に全角・半角と大文字・小文字の違いをならす"""
+    return unicodedata.normalize('NFKC', text).lower()
+
+def tokenize_search_text(text):
+    """検索用トークンに分割（英数字は単語、CJKは1文字と2文字のN-gram）"""
+    tokens = set()
+    for run in TOKEN_PATTERN.findall(normalize_search_text(text)):
+        if CJK_PATTERN.match(run):
+            tokens.update(run)
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.add(run)
+    return tokens
+
+def get_doc_version(page):
+    """ページの本文が変わったかを判断する版（最終更新日時・取得深さ・Markdownで描画したか）"""
+    return (page.get('last_edited_time'), page.get('max_depth', 0), page.get('markdown', False))
+
+class SearchIndex:
+    """ページのタイトル・本文に対する転置インデックス"""
+    
+    def __init__(self):
+        self.postings = {}
+        self.doc_tokens = {}
+        self.doc_versions = {}
+        self.words = None
+        self.build_ms = 0.0
+    
+    def to_state(self):
+        """保存用に組み込み型だけの辞書へ変換"""
+        return {
+            'postings': self.postings,
+            'doc_tokens': self.doc_tokens,
+            'doc_versions': self.doc_versions
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        """to_stateで保存した辞書から復元"""
+        search_index = cls()
+        search_index.postings = state['postings']
+        search_index.doc_tokens = state['doc_tokens']
+        search_index.doc_versions = state['doc_versions']
+        return search_index
+    
+    def add(self, page):
+        """ページを登録（登録済みなら入れ替え）"""
+        if page['id'] in self.doc_tokens:
+            self.remove(page['id'])
+        
+        tokens = tokenize_search_text(f"{page['title']}\n{page['content']}")
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(page['id'])
+        self.doc_tokens[page['id']] = tokens
+        self.doc_versions[page['id']] = get_doc_version(page)
+        self.words = None
+    
+    def remove(self, page_id):
+        """ページを登録解除"""
+        for token in self.doc_tokens.pop(page_id, ()):
+            doc_ids = self.postings.get(token)
+            if doc_ids is not None:
+                doc_ids.discard(page_id)
+                if not doc_ids:
+                    del self.postings[token]
+        self.doc_versions.pop(page_id, None)
+        self.words = None
+    
+    def sync(self, pages):
+        """ページ一覧に合わせて差分だけ登録・解除し、変更件数を返す"""
+        started = time.perf_counter()
+        changed = 0
+        page_ids = set()
+        for page in pages:
+            page_ids.add(page['id'])
+            version = get_doc_version(page)
+            if self.doc_versions.get(page['id']) != version or version[0] is None:
+                self.add(page)
+                changed += 1
+        for page_id in list(self.doc_tokens.keys() - page_ids):
+            self.remove(page_id)
+            changed += 1
+        self.build_ms = (time.perf_counter() - started) * 1000
+        return changed
+    
+    def match_word_prefix(self, word):
+        """前方一致する英数字トークンを持つページIDを返す"""
+        if self.words is None:
+            self.words = sorted(token for token in self.postings if not CJK_PATTERN.match(token))
+        doc_ids = set()
+        index = bisect_left(self.words, word)
+        while index < len(self.words) and self.words[index].startswith(word):
+            doc_ids |= self.postings[self.words[index]]
+            index += 1
+        return doc_ids
+    
+    def search(self, query, get_text=None):
+        """空白区切りの全ての語を含むページIDの集合を返す（get_textがあれば語順も照合）"""
+        result = None
+        for term in normalize_search_text(query).split():
+            runs = TOKEN_PATTERN.findall(term)
+            candidates = None
+            for run in runs:
+                if CJK_PATTERN.match(run):
+                    grams = [run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)]
+                    doc_ids = set.intersection(*[self.postings.get(gram, set()) for gram in grams])
+                else:
+                    doc_ids = self.match_word_prefix(run)
+                candidates = doc_ids if candidates is None else candidates & doc_ids
+                if not candidates:
+                    return set()
+            
+            if candidates is None:
+                continue
+            # N-gramや複数トークンの組み合わせは本文で連続しているかを確かめる
+            needs_check = len(runs) > 1 or (CJK_PATTERN.match(runs[0]) and len(runs[0]) > 2)
+            if needs_check and get_text:
+                candidates = {
+                    doc_id for doc_id in candidates
+                    if term in normalize_search_text(get_text(doc_id))
+                }
+            
+            result = candidates if result is None else result & candidates
+            if not result:
+                return set()
+        
+        return result if result is not None else set(self.doc_tokens)
+
+def load_search_index(database_id, filters):
+    """保存済みの検索インデックスを読み込み"""
+    state = load_search_index_state(database_id, filters)
+    return SearchIndex.from_state(state) if state else None
+
+def save_search_index(database_id, filters, search_index):
+    """検索インデックスを保存"""
+    save_search_index_state(database_id, filters, search_index.to_state())
+
+def build_search_index(database_id, filters, pages_data):
+    """保存済みインデックスを差分更新して返す（なければ新規作成）"""
+    search_index = load_search_index(database_id, filters) or SearchIndex()
+    if search_index.sync(pages_data):
+        save_search_index(database_id, filters, search_index)
+    return search_index
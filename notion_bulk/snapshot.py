@@ -0,0 +1,210 @@
+"""起動直後の読み込みを速くするための、ページ一覧のスナップショット（mmapで開く列形式のファイル）
+
+ページストアからの読み込みでは全ページの本文を展開するまで一覧を表示できない。
+スナップショットは本文をUTF-8のまま1つの領域に並べ、タイトル・件数・プレビューなどの列と
+本文の位置の索引を別に持つので、一覧は本文に触れずに作れる。本文はプレビュー・検索・書き出しで
+必要になったページの分だけ、mmapした領域から切り出して復号する。
+
+ファイルの構成:
+    MAGIC | 本文領域（UTF-8） | 索引（ページごとの開始・終了位置、uint64） | 列（JSON） | 末尾情報
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from .cache import evict, get_snapshot_path, normalize_database_id
+from .records import PREVIEW_CHARS, PageRecord
+
+# ファイルの先頭と末尾に置く識別子
+MAGIC = b"NBSNAP01"
+# 末尾情報（索引の位置, 列の位置, ページ数, 識別子）
+TRAILER = struct.Struct('<QQQ8s')
+# スナップショットに持つ列（本文以外）
+COLUMNS = ('id', 'title', 'category', 'tags', 'last_edited_time', 'char_count', 'line_count', 'preview')
+
+class SnapshotWriter:
+    """読み込んだページの本文を順に一時ファイルへ書き出し、最後に索引と列を付けて置き換える"""
+    
+    def __init__(self, database_id, filters, max_depth=0, markdown=False):
+        self.database_id = database_id
+        self.max_depth = max_depth
+        self.markdown = markdown
+        self.path = get_snapshot_path(database_id, filters, max_depth, markdown)
+        self.temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # ページID → (列の値, 本文の開始位置, 終了位置)
+        self.entries = {}
+        self.position = len(MAGIC)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.temp_path, 'wb')
+            self.file.write(MAGIC)
+        except OSError:
+            # 書き込めない場所では作らずに読み込みだけ続ける
+            self.file = None
+    
+    def add(self, page):
+        """本文を本文領域に追記"""
+        if self.file is None or page['id'] in self.entries:
+            return
+        body = page['content'].encode('utf-8')
+        try:
+            self.file.write(body)
+        except OSError:
+            self.discard()
+            return
+        values = {
+            'id': page['id'],
+            'title': page['title'],
+            'category': page.get('category', ''),
+            'tags': list(page.get('tags', ())),
+            'last_edited_time': page.get('last_edited_time'),
+            'char_count': page['char_count'],
+            'line_count': page['line_count'],
+            'preview': page['content'][:PREVIEW_CHARS]
+        }
+        self.entries[page['id']] = (values, self.position, self.position + len(body))
+        self.position += len(body)
+    
+    def finish(self, page_ids):
+        """page_idsの順に索引と列を書いてスナップショットを置き換える（足りないページがあれば作らない）"""
+        if self.file is None or any(page_id not in self.entries for page_id in page_ids):
+            self.discard()
+            return False
+        try:
+            offsets = array('Q')
+            columns = {name: [] for name in COLUMNS}
+            for page_id in page_ids:
+                values, start, end = self.entries[page_id]
+                offsets.extend((start, end))
+                for name in COLUMNS:
+                    columns[name].append(values[name])
+            
+            # 索引は8バイト境界から始める
+            padding = -self.position % 8
+            self.file.write(b"\0" * padding)
+            index_offset = self.position + padding
+            self.file.write(offsets.tobytes())
+            meta_offset = index_offset + len(offsets) * offsets.itemsize
+            self.file.write(json.dumps({
+                'database_id': self.database_id,
+                'max_depth': self.max_depth,
+                'markdown': self.markdown,
+                'created': time.time(),
+                'byteorder': sys.byteorder,
+                'columns': columns
+            }, ensure_ascii=False).encode('utf-8'))
+            self.file.write(TRAILER.pack(index_offset, meta_offset, len(page_ids), MAGIC))
+            self.file.close()
+            self.file = None
+            os.replace(self.temp_path, self.path)
+        except OSError:
+            # 書き込めなくても読み込み自体は続ける（次回はページストアから読む）
+            self.discard()
+            return False
+        # スナップショットもキャッシュの合計サイズに含めて上限を守る
+        evict()
+        return True
+    
+    def discard(self):
+        """書きかけの一時ファイルを削除"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+class CorpusSnapshot:
+    """mmapで開いたスナップショット（列はメモリに読み込み、本文は必要なときだけ復号する）"""
+    
+    def __init__(self, path, mapped, columns, offsets, database_id, max_depth, markdown=False):
+        self.path = path
+        self.mapped = mapped
+        self.columns = columns
+        self.offsets = offsets
+        self.database_id = database_id
+        self.max_depth = max_depth
+        self.markdown = markdown
+    
+    @classmethod
+    def open(cls, path):
+        """スナップショットを開く（ない・壊れている・別の環境で作られた場合はNone）"""
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            if len(mapped) < len(MAGIC) + TRAILER.size or mapped[:len(MAGIC)] != MAGIC:
+                raise ValueError("not a snapshot")
+            index_offset, meta_offset, count, magic = TRAILER.unpack(mapped[-TRAILER.size:])
+            if magic != MAGIC:
+                raise ValueError("truncated snapshot")
+            meta = json.loads(mapped[meta_offset:len(mapped) - TRAILER.size].decode('utf-8'))
+            if meta['byteorder'] != sys.byteorder:
+                raise ValueError("byte order mismatch")
+            offsets = array('Q', mapped[index_offset:meta_offset])
+            if len(offsets) != count * 2:
+                raise ValueError("broken index")
+        except (ValueError, KeyError, struct.error):
+            mapped.close()
+            return None
+        try:
+            # 上限を超えたときに最近使われたスナップショットを残すよう、使った時刻を記録する
+            os.utime(path)
+        except OSError:
+            pass
+        return cls(
+            path, mapped, meta['columns'], offsets, meta['database_id'], meta['max_depth'],
+            meta.get('markdown', False)
+        )
+    
+    def __len__(self):
+        return len(self.offsets) // 2
+    
+    def matches(self, page_refs):
+        """キャッシュのページ一覧（IDと最終更新日時）と同じ内容か"""
+        return (
+            self.columns['id'] == [ref['id'] for ref in page_refs]
+            and self.columns['last_edited_time'] == [ref.get('last_edited_time') for ref in page_refs]
+        )
+    
+    def read_content(self, index):
+        """index番目のページの本文を復号"""
+        return str(self.mapped[self.offsets[index * 2]:self.offsets[index * 2 + 1]], 'utf-8')
+    
+    def records(self, database_id=None):
+        """本文を読み込まずに全ページのPageRecordを作る（database_idは読み込み元として付けるID）"""
+        columns = self.columns
+        return [
+            PageRecord(
+                columns['id'][index], columns['title'][index],
+                columns['char_count'][index], columns['line_count'][index],
+                database_id=database_id or self.database_id,
+                category=columns['category'][index],
+                tags=columns['tags'][index],
+                last_edited_time=columns['last_edited_time'][index],
+                max_depth=self.max_depth,
+                markdown=self.markdown,
+                preview=columns['preview'][index],
+                snapshot=self,
+                snapshot_index=index
+            )
+            for index in range(len(self))
+        ]
+
+def open_snapshot(database_id, filters, max_depth, page_refs, markdown=False):
+    """キャッシュのページ一覧と一致するスナップショットを開く（古くなっていればNone）"""
+    snapshot = CorpusSnapshot.open(get_snapshot_path(database_id, filters, max_depth, markdown))
+    if snapshot is None:
+        return None
+    same_database = normalize_database_id(snapshot.database_id) == normalize_database_id(database_id)
+    if not same_database or not snapshot.matches(page_refs):
+        return None
+    return snapshot
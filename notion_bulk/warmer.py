@@ -0,0 +1,127 @@
+"""キャッシュの定期的な事前取得（朝一番の読み込みが全件取得にならないようにする）
+
+設定したデータベースとフィルタの組（プリセット）を一定間隔で差分更新し、検索インデックスも更新する。
+レート制限のうち rate_share の割合だけを使うので、画面からの読み込みを妨げない。
+キャッシュは子ブロックの深さ・Markdownかごとに別なので、画面で使う設定に合わせる（プリセットごとに変えられる）。
+
+    warmer = CacheWarmer(notion, [{'database_id': "xxxx", 'categories': ["仕様"]}], interval_sec=1800)
+    warmer.start()
+"""
+import threading
+import time
+from datetime import datetime
+
+from .loader import (
+    DEFAULT_MAX_BLOCK_DEPTH,
+    build_database_filters,
+    get_filter_options,
+    iter_databases_pages,
+)
+from .metrics import Metrics
+from .search import build_search_index
+
+# 事前取得の間隔のデフォルト
+DEFAULT_WARM_INTERVAL_SEC = 30 * 60
+# 事前取得に使うレート制限の割合のデフォルト
+DEFAULT_WARM_RATE_SHARE = 0.3
+
+def get_preset_name(preset):
+    """プリセットの表示名（データベースIDと絞り込み条件）"""
+    conditions = [*preset.get('categories', []), *preset.get('tags', [])]
+    return f"{preset['database_id']} ({', '.join(conditions)})" if conditions else preset['database_id']
+
+class CacheWarmer:
+    """プリセットのキャッシュをバックグラウンドで定期的に差分更新する"""
+    
+    def __init__(self, notion, presets, interval_sec=DEFAULT_WARM_INTERVAL_SEC,
+                 rate_share=DEFAULT_WARM_RATE_SHARE, max_depth=DEFAULT_MAX_BLOCK_DEPTH, markdown=False,
+                 on_log=None):
+        self.notion = notion
+        self.presets = presets
+        self.interval_sec = interval_sec
+        self.rate_share = rate_share
+        self.max_depth = max_depth
+        self.markdown = markdown
+        self.on_log = on_log
+        # プリセット名 → 直近の事前取得の結果
+        self.status = {}
+        self.next_run = None
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+    
+    def warm_preset(self, preset):
+        """1つのプリセットを差分更新し、結果を返す"""
+        database_id = preset['database_id']
+        categories = preset.get('categories', [])
+        tags = preset.get('tags', [])
+        max_depth = int(preset.get('max_depth', self.max_depth))
+        metrics = Metrics()
+        started = time.monotonic()
+        
+        # 画面と同じフィルタ（＝同じキャッシュのキー）になるよう、フィルタ設定から条件を組み立てる
+        filter_options_by_db = None
+        if categories or tags:
+            filter_options_by_db = {
+                database_id: get_filter_options(
+                    self.notion, database_id, metrics=metrics, rate_share=self.rate_share
+                )
+            }
+        sources = build_database_filters([database_id], categories, tags, filter_options_by_db)
+        
+        report = {}
+        pages_data = list(iter_databases_pages(
+            self.notion, sources, True, True, max_depth, report, metrics, self.rate_share,
+            markdown=preset.get('markdown', self.markdown)
+        ))
+        for _, filter_query in sources:
+            build_search_index(database_id, [filter_query], pages_data)
+        
+        return {
+            'finished_at': datetime.now(),
+            'seconds': round(time.monotonic() - started, 1),
+            'pages': len(pages_data),
+            'refetched': report.get('refetched', 0),
+            'failed': len(report.get('failed', [])),
+            'requests': sum(metrics.api_calls.values()),
+            'error': None
+        }
+    
+    def warm_once(self):
+        """全プリセットを1回ずつ差分更新"""
+        for preset in self.presets:
+            name = get_preset_name(preset)
+            try:
+                self.status[name] = self.warm_preset(preset)
+                result = self.status[name]
+                self.log(
+                    f"事前取得: {name}: {result['pages']}件 / 再取得 {result['refetched']}件 / "
+                    f"{result['requests']}リクエスト / {result['seconds']}秒"
+                )
+            except Exception as e:
+                # 1つのプリセットが失敗しても他は続ける
+                self.status[name] = {'finished_at': datetime.now(), 'error': str(e)}
+                self.log(f"事前取得に失敗: {name}: {e}")
+            if self.stop_event.is_set():
+                return
+    
+    def run(self):
+        """停止されるまで一定間隔で事前取得を繰り返す"""
+        while not self.stop_event.is_set():
+            self.warm_once()
+            self.next_run = datetime.fromtimestamp(time.time() + self.interval_sec)
+            self.stop_event.wait(self.interval_sec)
+    
+    def start(self):
+        """バックグラウンドスレッドで開始"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+    
+    def stop(self):
+        self.stop_event.set()
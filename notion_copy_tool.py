@@ -1,11 +1,34 @@
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # サブコマンド付きで実行されたらStreamlitを読み込まずにCLIとして動かす
+    # （python -m notion_copy_tool export ...）
+    from notion_bulk.cli import COMMANDS, main
+    if sys.argv[1] in COMMANDS:
+        sys.exit(main(sys.argv[1:]))
+
 import streamlit as st
 from notion_client import Client
-import json
+import time
+from contextlib import closing
 from datetime import datetime
-import pickle
+import json
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import hashlib
+
+from notion_bulk.cache import clear_cache, clear_database_cache, list_cached_datasets
+from notion_bulk.export import EXPORT_MIME_TYPES, iter_selected_pages, write_export
+from notion_bulk.coordinator import iter_shared_databases_pages
+from notion_bulk.facets import FacetIndex
+from notion_bulk.loader import (
+    DEFAULT_MAX_BLOCK_DEPTH,
+    build_database_filters,
+    get_filter_options,
+    merge_filter_options,
+)
+from notion_bulk.metrics import Metrics
+from notion_bulk.records import PREVIEW_CHARS, PageContentUnavailable, PageRecord, content_cache
+from notion_bulk.search import SearchIndex, build_search_index
+from notion_bulk.warmer import DEFAULT_WARM_INTERVAL_SEC, DEFAULT_WARM_RATE_SHARE, CacheWarmer
 
 # ページ設定
 st.set_page_config(
@@ -14,21 +37,116 @@ st.set_page_config(
     layout="wide"
 )
 
-# キャッシュディレクトリ
-CACHE_DIR = ".notion_cache"
+# エクスポート形式（表示名: 拡張子）
+EXPORT_FORMATS = {
+    "テキスト (.txt)": "txt",
+    "ページごとのMarkdown (.zip)": "zip",
+    "JSONL (.jsonl)": "jsonl"
+}
+# 一覧のページの本文がキャッシュから削除されていたときの案内
+CONTENT_UNAVAILABLE_MESSAGE = "一部のページの本文がキャッシュから削除されています。データベースを読み込み直してください"
+# 「テキストを表示」でテキストエリアに載せる最大文字数
+MAX_DISPLAY_CHARS = 200_000
+# 一覧の並び順（表示名: (並べ替えキー, 降順か)）。Noneはデータベースのクエリ結果の順
+SORT_ORDERS = {
+    "データベース順": None,
+    "タイトル順": (lambda page: page['title'], False),
+    "更新日時が新しい順": (lambda page: page.get('last_edited_time') or "", True),
+    "カテゴリ順": (lambda page: (page.get('category', ''), page['title']), False)
+}
 
-if not os.path.exists(CACHE_DIR):
-    os.makedirs(CACHE_DIR)
+class PageSelection:
+    """ページの選択状態（表示中の絞り込み結果に対する選択数を逐次更新で保持）"""
+    
+    def __init__(self):
+        self.selected = set()
+        self.view_key = None
+        self.view_ids = []
+        self.view_set = set()
+        self.view_selected = 0
+    
+    @property
+    def count(self):
+        return len(self.selected)
+    
+    def __contains__(self, page_id):
+        return page_id in self.selected
+    
+    def set_view(self, view_key, page_ids):
+        """絞り込み結果を設定（キーが変わったときだけ選択数を数え直す）"""
+        if view_key == self.view_key:
+            return
+        self.view_key = view_key
+        self.view_ids = page_ids
+        self.view_set = set(page_ids)
+        self.view_selected = len(self.view_set & self.selected)
+    
+    def is_view_all_selected(self):
+        return len(self.view_set) > 0 and self.view_selected == len(self.view_set)
+    
+    def toggle(self, page_id, checked):
+        """1ページの選択状態を変更（O(1)）"""
+        if checked and page_id not in self.selected:
+            self.selected.add(page_id)
+            if page_id in self.view_set:
+                self.view_selected += 1
+        elif not checked and page_id in self.selected:
+            self.selected.discard(page_id)
+            if page_id in self.view_set:
+                self.view_selected -= 1
+    
+    def select_view(self):
+        """絞り込み結果をすべて選択"""
+        self.selected |= self.view_set
+        self.view_selected = len(self.view_set)
+    
+    def deselect_view(self):
+        """絞り込み結果の選択をすべて解除"""
+        self.selected -= self.view_set
+        self.view_selected = 0
+    
+    def invert_view(self):
+        """絞り込み結果の選択を反転"""
+        self.selected ^= self.view_set
+        self.view_selected = len(self.view_set) - self.view_selected
+    
+    def select_range(self, start, end, checked=True):
+        """絞り込み結果の start〜end 番目（1始まり、両端を含む）を選択・解除"""
+        start, end = sorted((start, end))
+        for page_id in self.view_ids[max(start - 1, 0):end]:
+            self.toggle(page_id, checked)
+    
+    def clear(self):
+        self.selected.clear()
+        self.view_selected = 0
 
 # セッション状態の初期化
 if 'pages_data' not in st.session_state:
     st.session_state.pages_data = []
-if 'selected_pages' not in st.session_state:
-    st.session_state.selected_pages = set()
+if 'selection' not in st.session_state:
+    st.session_state.selection = PageSelection()
+if 'pages_version' not in st.session_state:
+    st.session_state.pages_version = 0
 if 'filter_options' not in st.session_state:
-    st.session_state.filter_options = {'categories': [], 'db_tags': []}
+    st.session_state.filter_options = {'categories': [], 'db_tags': [], 'db_tag_titles': {}}
+if 'filter_options_by_db' not in st.session_state:
+    st.session_state.filter_options_by_db = {}
 if 'select_all_checkbox' not in st.session_state:
     st.session_state.select_all_checkbox = False
+if 'search_index' not in st.session_state:
+    st.session_state.search_index = None
+if 'page_size' not in st.session_state:
+    st.session_state.page_size = 50
+if 'page_number' not in st.session_state:
+    st.session_state.page_number = 1
+if 'metrics' not in st.session_state:
+    st.session_state.metrics = None
+if 'loaded_database_ids' not in st.session_state:
+    st.session_state.loaded_database_ids = []
+if 'facet_index' not in st.session_state:
+    st.session_state.facet_index = None
+if 'priority_page_ids' not in st.session_state:
+    st.session_state.priority_page_ids = []
 
 # Streamlit Secretsから読み込み（クラウド版用）
 def get_default_token():
@@ -39,348 +157,162 @@ def get_default_token():
         return ""
 
 def get_default_database_id():
-    """デフォルトのデータベースIDを取得"""
+    """デフォルトのデータベースIDを取得（database_idsで複数指定した場合は1行に1つ）"""
     try:
+        database_ids = st.secrets.get("database_ids")
+        if database_ids:
+            return "\n".join(database_ids)
         return st.secrets.get("database_id", "")
     except:
         return ""
 
-def init_page_checkboxes():
-    """ページチェックボックスを初期化"""
-    for page in st.session_state.pages_data:
-        checkbox_key = f'page_check_{page["id"]}'
-        if checkbox_key not in st.session_state:
-            # 初期値を明示的に設定
-            st.session_state[checkbox_key] = False
+def parse_database_ids(text):
+    """1行に1つ（またはカンマ区切り）で入力されたデータベースIDを重複を除いて返す"""
+    database_ids = []
+    for database_id in text.replace(',', '\n').split('\n'):
+        database_id = database_id.strip()
+        if database_id and database_id not in database_ids:
+            database_ids.append(database_id)
+    return database_ids
+
+def get_database_label(database_id):
+    """一覧に表示する読み込み元データベースの名前（フィルタ設定を読み込んでいなければIDの先頭）"""
+    options = st.session_state.filter_options_by_db.get(database_id) or {}
+    return options.get('database_title') or database_id[:8]
+
+def get_facet_index():
+    """読み込み済みのページのファセット索引（読み込みが中断された場合などは作り直す）"""
+    facet_index = st.session_state.facet_index
+    if facet_index is None or len(facet_index.all_ids) != len(st.session_state.pages_data):
+        facet_index = st.session_state.facet_index = FacetIndex(st.session_state.pages_data)
+    return facet_index
+
+def get_local_edited_range():
+    """更新日の絞り込み範囲 (開始日, 終了日)（日付を1つだけ選んでいる間は開始日だけ）"""
+    dates = st.session_state.get('local_edited_range') or ()
+    if not dates:
+        return None
+    return (dates[0], dates[1] if len(dates) > 1 else None)
+
+def render_local_facet_filter(facet, label):
+    """ファセットの値を、選ぶと残るページ数付きで表示する複数選択"""
+    facet_index = get_facet_index()
+    key = f"local_{facet}"
+    options = facet_index.values(facet)
+    # 別のデータベースを読み込んだら、もうない値の選択は外す
+    if key in st.session_state:
+        st.session_state[key] = [value for value in st.session_state[key] if value in options]
+    selection = {name: st.session_state.get(f"local_{name}", []) for name in ('category', 'tags')}
+    counts = facet_index.counts(facet, selection, get_local_edited_range())
+    tag_titles = st.session_state.filter_options.get('db_tag_titles', {})
+    return st.multiselect(
+        label,
+        options=options,
+        format_func=lambda value: f"{tag_titles.get(value, value)} ({counts.get(value, 0)})",
+        key=key,
+        help="複数選択可能(OR条件)。括弧内は選ぶと表示されるページ数"
+    )
+
+def init_page_checkboxes(pages):
+    """表示中のページのチェックボックスを選択状態に合わせて初期化"""
+    selection = st.session_state.selection
+    for page in pages:
+        # 初期値を明示的に設定（すべて選択などで変わった選択状態を反映）
+        st.session_state[f'page_check_{page["id"]}'] = page['id'] in selection
 
 def changed_page_checkboxes_by_select_all():
-    """全て選択をTrueにした場合、選択ボタンをすべてTrueにする"""
+    """すべて選択の切り替えを、絞り込み中の全ページ（表示ページ以外も含む）に反映"""
     if st.session_state.select_all_checkbox:
-        for page in st.session_state.pages_data:
-            checkbox_key = f'page_check_{page["id"]}'
-            st.session_state[checkbox_key] = True
-            st.session_state.selected_pages.add(page['id'])
-    else:
-        pass
-
-def changed_select_all_by_page_checkboxes():
-    """選択ボタンの状態に応じて全て選択を更新"""
-    all_checked = True
-    any_checked = False
-    
-    for page in st.session_state.pages_data:
-        checkbox_key = f'page_check_{page["id"]}'
-        if checkbox_key in st.session_state:
-            if st.session_state[checkbox_key]:
-                any_checked = True
-                st.session_state.selected_pages.add(page['id'])
-            else:
-                all_checked = False
-                st.session_state.selected_pages.discard(page['id'])
-    
-    if all_checked and len(st.session_state.pages_data) > 0:
-        st.session_state.select_all_checkbox = True
+        st.session_state.selection.select_view()
     else:
-        st.session_state.select_all_checkbox = False
-
-def get_cache_path(database_id, filters):
-    """キャッシュファイルのパスを生成"""
-    filter_hash = hashlib.md5(str(filters).encode()).hexdigest()
-    return os.path.join(CACHE_DIR, f"cache_{database_id}_{filter_hash}.pkl")
-
-def save_cache(database_id, filters, data):
-    """キャッシュを保存"""
-    cache_path = get_cache_path(database_id, filters)
-    cache_data = {
-        'timestamp': datetime.now(),
-        'data': data
-    }
-    with open(cache_path, 'wb') as f:
-        pickle.dump(cache_data, f)
-
-def load_cache(database_id, filters):
-    """キャッシュを読み込み"""
-    cache_path = get_cache_path(database_id, filters)
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'rb') as f:
-                cache_data = pickle.load(f)
-            return cache_data
-        except:
-            return None
-    return None
+        st.session_state.selection.deselect_view()
 
-def extract_text_from_blocks(blocks):
-    """ブロックからテキストを抽出"""
-    text_content = []
-    
-    for block in blocks:
-        block_type = block.get('type')
-        
-        if block_type == 'paragraph':
-            rich_text = block.get('paragraph', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(text)
-        
-        elif block_type == 'heading_1':
-            rich_text = block.get('heading_1', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"\n# {text}\n")
-        
-        elif block_type == 'heading_2':
-            rich_text = block.get('heading_2', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"\n## {text}\n")
-        
-        elif block_type == 'heading_3':
-            rich_text = block.get('heading_3', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"\n### {text}\n")
-        
-        elif block_type == 'bulleted_list_item':
-            rich_text = block.get('bulleted_list_item', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"• {text}")
-        
-        elif block_type == 'numbered_list_item':
-            rich_text = block.get('numbered_list_item', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"1. {text}")
-        
-        elif block_type == 'code':
-            rich_text = block.get('code', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            language = block.get('code', {}).get('language', '')
-            if text:
-                text_content.append(f"```{language}\n{text}\n```")
-        
-        elif block_type == 'quote':
-            rich_text = block.get('quote', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"> {text}")
-        
-        elif block_type == 'toggle':
-            rich_text = block.get('toggle', {}).get('rich_text', [])
-            text = ''.join([t.get('plain_text', '') for t in rich_text])
-            if text:
-                text_content.append(f"▸ {text}")
-    
-    return '\n'.join(text_content)
+def changed_page_checkbox(page_id):
+    """1ページ分の選択状態を更新"""
+    st.session_state.selection.toggle(page_id, st.session_state[f'page_check_{page_id}'])
 
-def get_page_content(notion, page_id):
-    """ページの内容を取得"""
-    try:
-        page = notion.pages.retrieve(page_id=page_id)
-        
-        title = "無題"
-        if 'properties' in page:
-            for prop_name, prop_value in page['properties'].items():
-                if prop_value.get('type') == 'title':
-                    title_list = prop_value.get('title', [])
-                    if title_list:
-                        title = ''.join([t.get('plain_text', '') for t in title_list])
-                    break
-        
-        blocks = []
-        has_more = True
-        start_cursor = None
-        
-        while has_more:
-            if start_cursor:
-                response = notion.blocks.children.list(
-                    block_id=page_id,
-                    start_cursor=start_cursor
-                )
-            else:
-                response = notion.blocks.children.list(block_id=page_id)
-            
-            blocks.extend(response.get('results', []))
-            has_more = response.get('has_more', False)
-            start_cursor = response.get('next_cursor')
-        
-        content = extract_text_from_blocks(blocks)
-        
-        return {
-            'id': page_id,
-            'title': title,
-            'content': content,
-            'char_count': len(content),
-            'line_count': len(content.split('\n'))
-        }
-    
-    except Exception as e:
-        return None
+def clicked_invert_selection():
+    """絞り込み中のページの選択を反転"""
+    st.session_state.selection.invert_view()
 
-def get_filter_options(notion, database_id):
-    """データベースからフィルタオプションを取得"""
-    try:
-        database = notion.databases.retrieve(database_id=database_id)
-        properties = database.get('properties', {})
-        
-        options = {'categories': [], 'db_tags': []}
-        
-        if 'カテゴリ' in properties:
-            prop = properties['カテゴリ']
-            if prop.get('type') == 'select':
-                select_options = prop.get('select', {}).get('options', [])
-                options['categories'] = [opt.get('name') for opt in select_options]
-            elif prop.get('type') == 'multi_select':
-                select_options = prop.get('multi_select', {}).get('options', [])
-                options['categories'] = [opt.get('name') for opt in select_options]
-        
-        if 'DB_tag' in properties:
-            prop = properties['DB_tag']
-            prop_type = prop.get('type')
-            
-            if prop_type == 'select':
-                select_options = prop.get('select', {}).get('options', [])
-                options['db_tags'] = [opt.get('name') for opt in select_options]
-            elif prop_type == 'multi_select':
-                select_options = prop.get('multi_select', {}).get('options', [])
-                options['db_tags'] = [opt.get('name') for opt in select_options]
-            elif prop_type == 'relation':
-                relation_db_id = prop.get('relation', {}).get('database_id')
-                if relation_db_id:
-                    relation_pages = []
-                    has_more = True
-                    start_cursor = None
-                    
-                    while has_more:
-                        if start_cursor:
-                            response = notion.databases.query(
-                                database_id=relation_db_id,
-                                start_cursor=start_cursor
-                            )
-                        else:
-                            response = notion.databases.query(database_id=relation_db_id)
-                        
-                        for page in response.get('results', []):
-                            page_props = page.get('properties', {})
-                            for prop_name, prop_value in page_props.items():
-                                if prop_value.get('type') == 'title':
-                                    title_list = prop_value.get('title', [])
-                                    if title_list:
-                                        title = ''.join([t.get('plain_text', '') for t in title_list])
-                                        if title:
-                                            relation_pages.append(title)
-                                    break
-                        
-                        has_more = response.get('has_more', False)
-                        start_cursor = response.get('next_cursor')
-                    
-                    options['db_tags'] = sorted(list(set(relation_pages)))
-        
-        return options
-    except Exception as e:
-        st.error(f"フィルタオプション取得エラー: {str(e)}")
-        return {'categories': [], 'db_tags': []}
-
-def build_filter_query(selected_categories, selected_db_tags):
-    """Notion APIフィルタクエリを構築"""
-    filters = []
-    
-    if selected_categories:
-        if len(selected_categories) == 1:
-            filters.append({
-                "property": "カテゴリ",
-                "select": {"equals": selected_categories[0]}
-            })
-        else:
-            category_filters = [
-                {"property": "カテゴリ", "select": {"equals": cat}}
-                for cat in selected_categories
-            ]
-            filters.append({"or": category_filters})
-    
-    if selected_db_tags:
-        if len(selected_db_tags) == 1:
-            filters.append({
-                "property": "DB_tag",
-                "relation": {"contains": selected_db_tags[0]}
-            })
-        else:
-            tag_filters = [
-                {"property": "DB_tag", "relation": {"contains": tag}}
-                for tag in selected_db_tags
-            ]
-            filters.append({"or": tag_filters})
-    
-    if len(filters) == 0:
-        return None
-    elif len(filters) == 1:
-        return filters[0]
-    else:
-        return {"and": filters}
+def clicked_select_range(checked):
+    """指定範囲のページを選択・解除"""
+    st.session_state.selection.select_range(
+        st.session_state.range_start,
+        st.session_state.range_end,
+        checked
+    )
+
+def get_priority_page_ids():
+    """次の読み込みで先に取得するページ（選択中のページ、直前に表示していたページと検索結果の1ページ目）"""
+    return [*st.session_state.selection.selected, *st.session_state.priority_page_ids]
 
-def load_database_pages(notion, database_id, filter_query=None, use_cache=True):
-    """データベースから全ページを並列取得"""
+def load_database_pages(notion, sources, use_cache=True, incremental=False,
+                        max_depth=0, on_page=None, metrics=None, priority_ids=(), markdown=False):
+    """データベース（(データベースID, フィルタ) のリスト）から全ページを並列取得し、PageRecordのリストを返す
+    
+    差分更新に対応し、on_pageで1件ずつ通知する。priority_idsのページは他のページより先に取得する。
+    markdownなら本文の装飾（太字・リンクなど）をMarkdownで出力する。
+    画面の再実行などで中断されると、他のセッションが待っていなければ残りの取得も止める。
+    """
     try:
-        if use_cache:
-            cached = load_cache(database_id, filter_query)
-            if cached:
-                cache_time = cached['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                st.info(f"📦 キャッシュを使用 (取得日時: {cache_time})")
-                return cached['data']
-        
-        page_ids = []
-        has_more = True
-        start_cursor = None
-        
-        with st.spinner('ページ一覧を取得中...'):
-            while has_more:
-                query_params = {"database_id": database_id}
-                
-                if filter_query:
-                    query_params["filter"] = filter_query
-                
-                if start_cursor:
-                    query_params["start_cursor"] = start_cursor
-                
-                response = notion.databases.query(**query_params)
-                
-                for page in response.get('results', []):
-                    page_ids.append(page['id'])
-                
-                has_more = response.get('has_more', False)
-                start_cursor = response.get('next_cursor')
-        
-        if len(page_ids) == 0:
-            st.warning("⚠️ フィルタ条件に一致するページが見つかりませんでした")
-            return []
-        
+        report = {}
+        metrics = metrics or Metrics()
+        started = time.perf_counter()
         pages_data = []
         progress_bar = st.progress(0)
         status_text = st.empty()
+        status_text.text("ページ一覧を取得中...")
         
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_id = {
-                executor.submit(get_page_content, notion, page_id): page_id 
-                for page_id in page_ids
-            }
-            
-            completed = 0
-            total = len(page_ids)
-            
-            for future in as_completed(future_to_id):
-                page_content = future.result()
-                if page_content:
-                    pages_data.append(page_content)
+        # 他のセッションが同じ条件で読み込み中なら、その結果を一緒に受け取る
+        pages_iter = iter_shared_databases_pages(
+            notion, sources, use_cache, incremental, max_depth, report, metrics, priority_ids, markdown
+        )
+        with closing(pages_iter):
+            for page_content in pages_iter:
+                # セッションには本文を持たない記録だけを置く（本文はプロセス全体で共有）
+                # スナップショットから読んだページは、本文を読み込まずにそのまま使う
+                if isinstance(page_content, PageRecord):
+                    page = page_content
+                else:
+                    page = PageRecord.from_page(page_content)
+                pages_data.append(page)
+                if on_page:
+                    on_page(page)
                 
-                completed += 1
-                progress_bar.progress(completed / total)
+                total = len(report['order'])
+                completed = len(pages_data) + len(report['failed'])
+                progress_bar.progress(min(completed / total, 1.0))
                 status_text.text(f"読み込み中: {completed}/{total} ページ")
         
         progress_bar.empty()
         status_text.empty()
+        metrics.add_stage('total', time.perf_counter() - started)
+        
+        # 取得できた順ではなくクエリ結果の順に並べ直す
+        order = {page_id: index for index, page_id in enumerate(report['order'])}
+        pages_data.sort(key=lambda page: order.get(page['id'], len(order)))
+        
+        if report.get('shared'):
+            st.info("🤝 他のセッションが同じ条件で読み込み中だったため、その結果を共有しました")
+        if report['cache_time']:
+            cache_time = report['cache_time'].strftime("%Y-%m-%d %H:%M:%S")
+            st.info(f"📦 キャッシュを使用 (取得日時: {cache_time})")
+        elif report['incremental']:
+            st.info(
+                f"🔁 差分更新: 再利用 {report['reused']}件 / "
+                f"再取得 {report['refetched']}件 / 削除 {report['removed']}件"
+            )
         
-        save_cache(database_id, filter_query, pages_data)
+        failed_pages = report['failed']
+        if failed_pages:
+            st.warning(f"⚠️ {len(failed_pages)}件のページを取得できませんでした（次回の読み込みで再取得します）")
+            with st.expander("取得できなかったページ"):
+                for failed in failed_pages:
+                    st.text(f"{failed['id']}: {failed['error']}")
+        
+        if len(pages_data) == 0 and not failed_pages:
+            st.warning("⚠️ フィルタ条件に一致するページが見つかりませんでした")
         
         return pages_data
     
@@ -388,10 +320,192 @@ def load_database_pages(notion, database_id, filter_query=None, use_cache=True):
         st.error(f"データベース読み込みエラー: {str(e)}")
         return []
 
+def render_metrics_panel(metrics):
+    """直近の読み込みの計測値（エンドポイント別・処理段階別）を表示"""
+    data = metrics.to_dict()
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        hit_ratio = data['cache_hit_ratio']
+        st.metric("キャッシュヒット率", f"{hit_ratio:.0%}" if hit_ratio is not None else "-")
+    with col2:
+        st.metric("429/5xx待ち", f"{data['throttled_seconds']:.1f}秒")
+    with col3:
+        st.metric("受信量", f"{data['bytes_received'] / 1024:,.0f}KB")
+    
+    if data['block_cache_hits'] or data['block_cache_misses']:
+        st.caption(
+            f"🧱 更新されたページのブロック: 再利用 {data['block_cache_hits']}件 / "
+            f"再取得 {data['block_cache_misses']}件"
+        )
+    
+    if data['api_calls']:
+        st.caption("APIリクエスト")
+        st.table([
+            {
+                "エンドポイント": endpoint,
+                "回数": count,
+                "平均(ms)": round(data['api_latency_seconds'][endpoint]['mean'] * 1000, 1),
+                "リトライ": data['retries'].get(endpoint, 0)
+            }
+            for endpoint, count in sorted(data['api_calls'].items())
+        ])
+    
+    if data['stage_seconds']:
+        # 並列に実行される段階は合計時間が実時間を上回る
+        st.caption("処理段階ごとの時間（並列処理分は合算）")
+        st.table([
+            {"段階": name, "合計(秒)": round(seconds, 3), "回数": data['stage_counts'][name]}
+            for name, seconds in sorted(data['stage_seconds'].items(), key=lambda item: -item[1])
+        ])
+    
+    if data['api_errors']:
+        st.caption("エラー応答")
+        st.table([{"エンドポイント / ステータス": key, "回数": count} for key, count in data['api_errors'].items()])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "JSON", data=metrics.to_json(), file_name="notion_metrics.json",
+            mime="application/json", use_container_width=True
+        )
+    with col2:
+        st.download_button(
+            "Prometheus", data=metrics.to_prometheus(), file_name="notion_metrics.prom",
+            mime="text/plain", use_container_width=True
+        )
+
+def sort_pages(pages, sort_label):
+    """一覧の並び順に並べ替えたリストを返す"""
+    sort_order = SORT_ORDERS[sort_label]
+    if sort_order is None:
+        return pages
+    key, reverse = sort_order
+    return sorted(pages, key=key, reverse=reverse)
+
+def render_streaming_pages(placeholder, pages, search_query, limit=20):
+    """読み込み中のページ一覧（検索語に一致するもの）をプレースホルダーに表示"""
+    content_unavailable = False
+    if search_query:
+        query = search_query.lower()
+        try:
+            pages = [
+                p for p in pages
+                if query in p['title'].lower() or query in p['content'].lower()
+            ]
+        except PageContentUnavailable:
+            content_unavailable = True
+            pages = []
+    
+    with placeholder.container():
+        if content_unavailable:
+            st.error(CONTENT_UNAVAILABLE_MESSAGE)
+        st.caption(f"⏳ 読み込み中... {len(pages)}件表示可能（最新{limit}件を表示）")
+        for page in pages[-limit:]:
+            st.markdown(f"**{page['title']}**")
+            preview = page['preview'].replace('\n', ' ')
+            st.caption(f"{preview}..." if page['char_count'] > PREVIEW_CHARS else preview)
+
+@st.cache_resource
+def start_cache_warmer(token, presets_json, interval_sec, rate_share, max_depth):
+    """プロセスに1つだけキャッシュの事前取得を開始（全セッションで共有）"""
+    return CacheWarmer(Client(auth=token), json.loads(presets_json), interval_sec, rate_share, max_depth).start()
+
+def get_cache_warmer():
+    """Secretsの warm_presets が設定されていれば事前取得を開始して返す"""
+    try:
+        presets = st.secrets.get("warm_presets")
+        if not presets or not st.secrets.get("notion_token"):
+            return None
+        return start_cache_warmer(
+            st.secrets["notion_token"],
+            json.dumps([dict(preset) for preset in presets], ensure_ascii=False),
+            float(st.secrets.get("warm_interval_minutes", DEFAULT_WARM_INTERVAL_SEC / 60)) * 60,
+            float(st.secrets.get("warm_rate_share", DEFAULT_WARM_RATE_SHARE)),
+            int(st.secrets.get("warm_max_depth", DEFAULT_MAX_BLOCK_DEPTH))
+        )
+    except Exception:
+        return None
+
+def format_age(timestamp):
+    """日時が現在からどれだけ前かを表示用に整形"""
+    seconds = (datetime.now() - timestamp).total_seconds()
+    if seconds < 60:
+        return "1分以内"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}分前"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)}時間前"
+    return f"{int(seconds // 86400)}日前"
+
+def render_freshness_panel(warmer):
+    """キャッシュにあるデータベース・フィルタの組ごとの鮮度と、事前取得の状況を表示"""
+    datasets = list_cached_datasets()
+    if datasets:
+        st.table([
+            {
+                "データベース": dataset['database_id'][:8],
+                "条件": "なし" if dataset['filters'] is None
+                        else json.dumps(dataset['filters'], ensure_ascii=False)[:40],
+                "ページ数": dataset['page_count'] if dataset['page_count'] is not None else "-",
+                "更新": format_age(dataset['timestamp'])
+            }
+            for dataset in datasets
+        ])
+    else:
+        st.caption("キャッシュはまだありません")
+    
+    if warmer is None:
+        st.caption("事前取得は設定されていません（Secretsの warm_presets で設定）")
+        return
+    for name, status in warmer.status.items():
+        if status['error']:
+            st.caption(f"⚠️ {name}: {format_age(status['finished_at'])}に失敗 ({status['error']})")
+        else:
+            st.caption(
+                f"🔁 {name}: {format_age(status['finished_at'])}に更新 / "
+                f"{status['pages']}件 / 再取得 {status['refetched']}件"
+            )
+    if warmer.next_run:
+        st.caption(f"次回の事前取得: {warmer.next_run.strftime('%H:%M')}")
+
+def replace_export_file(export_path):
+    """前回のエクスポートファイルを削除して新しいファイルに差し替え"""
+    previous_path = st.session_state.get('export_path')
+    if previous_path and previous_path != export_path and os.path.exists(previous_path):
+        os.remove(previous_path)
+    st.session_state.export_path = export_path
+
+def export_selected_pages(export_format):
+    """選択ページを書き出して差し替える（本文がキャッシュから削除されていたらエラーを表示してNone）"""
+    try:
+        export_path = write_export(
+            iter_selected_pages(st.session_state.pages_data, st.session_state.selection),
+            export_format
+        )
+    except PageContentUnavailable:
+        st.error(CONTENT_UNAVAILABLE_MESSAGE)
+        return None
+    replace_export_file(export_path)
+    return export_path
+
+def read_text_head(path, max_chars):
+    """テキストファイルの先頭だけを読み込み（全体が収まったかも返す）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read(max_chars)
+        is_complete = f.read(1) == ""
+    return text, is_complete
+
+# 設定されていれば、キャッシュの事前取得をバックグラウンドで続ける
+cache_warmer = get_cache_warmer()
+
 # メインUI
 st.title("📝 Notion一括コピーツール")
 st.markdown("---")
 
+# 読み込み中のページを逐次表示する領域
+streaming_area = st.empty()
+
 # サイドバー: 設定
 with st.sidebar:
     st.header("⚙️ 設定")
@@ -407,20 +521,26 @@ with st.sidebar:
         help="Notionインテグレーションのトークンを入力"
     )
     
-    database_id = st.text_input(
+    database_ids = parse_database_ids(st.text_area(
         "データベースID",
         value=default_db_id,
-        help="NotionデータベースのIDを入力"
-    )
+        height=68,
+        help="NotionデータベースのIDを入力（複数のデータベースをまとめて読み込む場合は1行に1つ）"
+    ))
     
     if st.button("🔍 フィルタ設定を読み込み", use_container_width=True):
-        if not notion_token or not database_id:
+        if not notion_token or not database_ids:
             st.error("API TokenとデータベースIDを入力してください")
         else:
             try:
                 with st.spinner('フィルタ設定を読み込み中...'):
                     notion = Client(auth=notion_token)
-                    st.session_state.filter_options = get_filter_options(notion, database_id)
+                    st.session_state.filter_options_by_db = {
+                        database_id: get_filter_options(notion, database_id) for database_id in database_ids
+                    }
+                    st.session_state.filter_options = merge_filter_options(
+                        st.session_state.filter_options_by_db.values()
+                    )
                 st.success("✅ フィルタ設定を読み込みました!")
             except Exception as e:
                 st.error(f"❌ エラー: {str(e)}")
@@ -428,8 +548,22 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("📋 フィルタ条件")
     
+    local_filtering = st.checkbox(
+        "⚡ 全件を読み込んで手元で絞り込む",
+        key="local_filtering",
+        help="データベース全体を1回読み込み、カテゴリ・DB_tag・更新日の絞り込みはAPIを呼ばずにその場で行う"
+    )
+    
     selected_categories = []
-    if st.session_state.filter_options['categories']:
+    selected_db_tags = []
+    if local_filtering:
+        if st.session_state.pages_data:
+            render_local_facet_filter('category', "カテゴリ")
+            render_local_facet_filter('tags', "DB_tag")
+            st.date_input("更新日", value=(), key="local_edited_range", help="更新日（UTC）の範囲で絞り込み")
+        else:
+            st.caption("ページを読み込むと、読み込んだページから絞り込み条件を選べます")
+    elif st.session_state.filter_options['categories']:
         # すべて選択ボタン（カテゴリ）
         if st.button("✅ カテゴリ: すべて選択", use_container_width=True, key="select_all_categories"):
             # セッション状態に保存して、プルダウンのデフォルト値として使用
@@ -452,8 +586,7 @@ with st.sidebar:
     else:
         st.caption("フィルタ設定を読み込んでください")
     
-    selected_db_tags = []
-    if st.session_state.filter_options['db_tags']:
+    if not local_filtering and st.session_state.filter_options['db_tags']:
         # すべて選択ボタン（DB_tag）
         if st.button("✅ DB_tag: すべて選択", use_container_width=True, key="select_all_db_tags"):
             # セッション状態に保存して、プルダウンのデフォルト値として使用
@@ -476,36 +609,123 @@ with st.sidebar:
     
     st.markdown("---")
     
-    use_cache = st.checkbox("キャッシュを使用", value=True, help="前回の読み込み結果を再利用")
+    load_mode = st.radio(
+        "読み込みモード",
+        options=["キャッシュを使用", "差分更新", "全件再取得"],
+        index=0,
+        help="キャッシュを使用: 前回の読み込み結果をそのまま再利用 / "
+             "差分更新: 更新日時が変わったページだけ再取得 / "
+             "全件再取得: すべてのページを取得し直す"
+    )
+    use_cache = load_mode == "キャッシュを使用"
+    incremental = load_mode == "差分更新"
+    
+    max_depth = st.number_input(
+        "子ブロックの最大深さ",
+        min_value=0,
+        max_value=10,
+        value=DEFAULT_MAX_BLOCK_DEPTH,
+        help="トグルやリスト、カラムの中身をどの階層まで取得するか（0でトップレベルのみ）"
+    )
+    
+    markdown = st.checkbox(
+        "装飾をMarkdownで出力",
+        value=False,
+        help="太字・斜体・コード・リンクなどをMarkdownの記法で本文に含める（切り替えると読み込み直しになります）"
+    )
+    
+    stream_results = st.checkbox(
+        "読み込み中に結果を逐次表示",
+        value=True,
+        help="取得できたページから順に一覧・検索結果に表示"
+    )
     
     if st.button("🔄 ページを読み込み", use_container_width=True, type="primary"):
-        if not notion_token or not database_id:
+        if not notion_token or not database_ids:
             st.error("API TokenとデータベースIDを入力してください")
         else:
             try:
                 notion = Client(auth=notion_token)
-                filter_query = build_filter_query(selected_categories, selected_db_tags)
-                st.session_state.pages_data = load_database_pages(
+                # データベースごとに、そのデータベースにある選択肢だけで絞り込む
+                # （手元で絞り込む場合は条件を付けずに全件を読み込む）
+                sources = build_database_filters(
+                    database_ids,
+                    selected_categories,
+                    selected_db_tags,
+                    st.session_state.filter_options_by_db
+                )
+                
+                # 選択中・表示中のページを先に取得する（選択は下でリセットするので先に取り出す）
+                priority_ids = get_priority_page_ids()
+                # 途中で中断されても、取得済みのページは一覧に残す
+                # （前回の一覧に対する絞り込み結果と選択は、読み込みを始めた時点で捨てる）
+                st.session_state.pages_data = []
+                st.session_state.selection = PageSelection()
+                st.session_state.pages_version += 1
+                last_rendered = [0.0]
+                
+                def on_page(page):
+                    st.session_state.pages_data.append(page)
+                    # 描画は間引いて行う
+                    if stream_results and time.monotonic() - last_rendered[0] > 0.5:
+                        render_streaming_pages(
+                            streaming_area,
+                            st.session_state.pages_data,
+                            st.session_state.get('search_box', '')
+                        )
+                        last_rendered[0] = time.monotonic()
+                
+                metrics = Metrics()
+                pages_data = load_database_pages(
                     notion, 
-                    database_id, 
-                    filter_query,
-                    use_cache
+                    sources,
+                    use_cache,
+                    incremental,
+                    int(max_depth),
+                    on_page,
+                    metrics,
+                    priority_ids,
+                    markdown
                 )
-                st.session_state.selected_pages = set()
+                st.session_state.metrics = metrics
+                streaming_area.empty()
+                st.session_state.pages_data = pages_data
+                with metrics.stage('search_index'):
+                    st.session_state.search_index = build_search_index(
+                        ','.join(database_ids),
+                        [filter_query for _, filter_query in sources],
+                        pages_data
+                    )
+                with metrics.stage('facet_index'):
+                    st.session_state.facet_index = FacetIndex(pages_data)
+                st.session_state.loaded_database_ids = [database_id for database_id, _ in sources]
+                # 並べ直した一覧で絞り込み結果を作り直す
+                st.session_state.pages_version += 1
                 st.success(f"✅ {len(st.session_state.pages_data)}件のページを読み込みました!")
             except Exception as e:
                 st.error(f"エラー: {str(e)}")
     
+    if st.button("🗑️ このデータベースのキャッシュを削除", use_container_width=True, disabled=not database_ids):
+        for database_id in database_ids:
+            clear_database_cache(database_id)
+        # プロセス内で共有している本文も捨てる（他のデータベースの本文は次に使うときに読み直す）
+        content_cache.clear()
+        st.success("このデータベースのキャッシュを削除しました!")
+    
     if st.button("🗑️ キャッシュをクリア", use_container_width=True):
-        import shutil
-        if os.path.exists(CACHE_DIR):
-            shutil.rmtree(CACHE_DIR)
-            os.makedirs(CACHE_DIR)
-            st.success("キャッシュをクリアしました!")
+        clear_cache()
+        content_cache.clear()
+        st.success("キャッシュをクリアしました!")
     
     st.markdown("---")
     st.markdown(f"**読み込み済み:** {len(st.session_state.pages_data)}件")
-    st.markdown(f"**選択中:** {len(st.session_state.selected_pages)}件")
+    st.markdown(f"**選択中:** {st.session_state.selection.count}件")
+    
+    if st.session_state.metrics and st.checkbox("🩺 診断情報を表示", help="直近の読み込みのリクエスト数や処理時間"):
+        render_metrics_panel(st.session_state.metrics)
+    
+    if st.checkbox("🕒 キャッシュの鮮度を表示", help="キャッシュにあるデータベース・フィルタごとの最終更新"):
+        render_freshness_panel(cache_warmer)
 
 # メインエリア
 if len(st.session_state.pages_data) == 0:
@@ -533,7 +753,7 @@ if len(st.session_state.pages_data) == 0:
         - **フィルタ**: 必要なページだけを取得することで、読み込み時間を大幅に短縮できます
         """)
 else:
-    col1, col2 = st.columns([7, 1])
+    col1, col2, col3 = st.columns([5, 2, 1])
     with col1:
         search_query = st.text_input(
             "🔍 検索",
@@ -542,32 +762,118 @@ else:
             key="search_box"
         )
     with col2:
+        sort_label = st.selectbox(
+            "並び順",
+            options=list(SORT_ORDERS.keys()),
+            label_visibility="collapsed",
+            key="sort_order"
+        )
+    with col3:
         search_button = st.button("🔍 検索", use_container_width=True)
     
+    # 読み込みが中断された場合などはインデックスを差分更新する
+    search_index = st.session_state.search_index
+    if search_index is None:
+        search_index = st.session_state.search_index = SearchIndex()
+    if len(search_index.doc_tokens) != len(st.session_state.pages_data):
+        search_index.sync(st.session_state.pages_data)
+    
     filtered_pages = st.session_state.pages_data
+    local_view_key = None
+    if local_filtering:
+        local_selection = {
+            'category': st.session_state.get('local_category', []),
+            'tags': st.session_state.get('local_tags', [])
+        }
+        edited_range = get_local_edited_range()
+        local_view_key = (str(local_selection), str(edited_range))
+        matched_ids = get_facet_index().filter(local_selection, edited_range)
+        filtered_pages = [p for p in filtered_pages if p['id'] in matched_ids]
+    
+    search_ms = None
     if search_query:
-        filtered_pages = [
-            p for p in st.session_state.pages_data
-            if search_query.lower() in p['title'].lower() or 
-               search_query.lower() in p['content'].lower()
-        ]
+        pages_by_id = {p['id']: p for p in st.session_state.pages_data}
+        started = time.perf_counter()
+        try:
+            matched_ids = search_index.search(
+                search_query,
+                lambda page_id: f"{pages_by_id[page_id]['title']}\n{pages_by_id[page_id]['content']}"
+            )
+        except PageContentUnavailable:
+            st.error(CONTENT_UNAVAILABLE_MESSAGE)
+            matched_ids = set()
+        search_ms = (time.perf_counter() - started) * 1000
+        filtered_pages = [p for p in filtered_pages if p['id'] in matched_ids]
+    filtered_pages = sort_pages(filtered_pages, sort_label)
     
-    init_page_checkboxes()
+    index_caption = f"🗂️ 検索インデックス: {len(search_index.doc_tokens)}件 / 構築 {search_index.build_ms:.0f} ms"
+    if search_ms is not None:
+        index_caption += f" / 検索 {search_ms:.1f} ms"
+    st.caption(index_caption)
     
-    col1, col2 = st.columns([1, 5])
+    # 絞り込み結果が変わったときだけ選択数を数え直す
+    selection = st.session_state.selection
+    selection.set_view(
+        (st.session_state.pages_version, search_query, sort_label, local_view_key),
+        [p['id'] for p in filtered_pages]
+    )
+    st.session_state.select_all_checkbox = selection.is_view_all_selected()
+    
+    col1, col2, col3, col4 = st.columns([1, 3, 1, 1])
     with col1:
         st.checkbox(
             "✅ すべて選択",
-            value=st.session_state.select_all_checkbox,
             key='select_all_checkbox',
             on_change=changed_page_checkboxes_by_select_all
         )
+        st.button("🔁 選択を反転", on_click=clicked_invert_selection)
     with col2:
-        st.markdown(f"**表示中:** {len(filtered_pages)}件 / 全{len(st.session_state.pages_data)}件")
+        st.markdown(
+            f"**表示中:** {len(filtered_pages)}件 / 全{len(st.session_state.pages_data)}件 "
+            f"（うち選択中 {selection.view_selected}件）"
+        )
+        with st.expander("範囲選択"):
+            range_col1, range_col2 = st.columns(2)
+            with range_col1:
+                st.number_input("開始（番目）", min_value=1, value=1, step=1, key='range_start')
+            with range_col2:
+                st.number_input("終了（番目）", min_value=1, value=1, step=1, key='range_end')
+            range_col3, range_col4 = st.columns(2)
+            with range_col3:
+                st.button("範囲を選択", on_click=clicked_select_range, args=(True,), use_container_width=True)
+            with range_col4:
+                st.button("範囲を解除", on_click=clicked_select_range, args=(False,), use_container_width=True)
+    
+    # 表示するのは現在のページ分だけ（選択・すべて選択は絞り込み結果全体が対象）
+    total_pages = max(1, -(-len(filtered_pages) // st.session_state.page_size))
+    if st.session_state.page_number > total_pages:
+        st.session_state.page_number = 1
+    with col3:
+        st.selectbox(
+            "表示件数",
+            options=[25, 50, 100, 200],
+            key='page_size'
+        )
+    with col4:
+        st.number_input(
+            f"ページ (全{total_pages})",
+            min_value=1,
+            max_value=total_pages,
+            step=1,
+            key='page_number'
+        )
+    
+    page_start = (st.session_state.page_number - 1) * st.session_state.page_size
+    visible_pages = filtered_pages[page_start:page_start + st.session_state.page_size]
+    # 再読み込みでは、いま表示しているページと検索結果の1ページ目を先に取得する
+    st.session_state.priority_page_ids = [p['id'] for p in visible_pages]
+    if search_query:
+        st.session_state.priority_page_ids += [p['id'] for p in filtered_pages[:st.session_state.page_size]]
+    init_page_checkboxes(visible_pages)
     
     st.markdown("---")
     
-    for idx, page in enumerate(filtered_pages):
+    for page in visible_pages:
         col1, col2, col3 = st.columns([0.5, 6, 2])
         
         with col1:
@@ -577,56 +883,72 @@ else:
                 label=f"選択_{page['id']}",
                 key=checkbox_key,
                 label_visibility="collapsed",
-                on_change=changed_select_all_by_page_checkboxes
+                on_change=changed_page_checkbox,
+                args=(page['id'],)
             )
         
         with col2:
             st.markdown(f"**{page['title']}**")
-            preview = page['content'][:100].replace('\n', ' ')
-            st.caption(f"{preview}..." if len(page['content']) > 100 else preview)
+            preview = page['preview'].replace('\n', ' ')
+            st.caption(f"{preview}..." if page['char_count'] > PREVIEW_CHARS else preview)
         
         with col3:
             st.caption(f"📄 {page['line_count']}行 / {page['char_count']}文字")
+            # リレーションのタグはページIDなので、フィルタ設定のタイトルに置き換えて表示
+            tag_titles = st.session_state.filter_options.get('db_tag_titles', {})
+            tags = [tag_titles.get(tag, tag) for tag in page.get('tags', [])]
+            labels = [label for label in [page.get('category'), *tags] if label]
+            # 複数のデータベースを読み込んだときは読み込み元も表示
+            if len(st.session_state.loaded_database_ids) > 1:
+                labels.insert(0, f"🗂️ {get_database_label(page.get('database_id') or '')}")
+            if labels:
+                st.caption(f"🏷️ {' / '.join(labels)}")
     
     st.markdown("---")
     col1, col2 = st.columns([2, 2])
     
     with col1:
         if st.button("📄 テキストを表示", use_container_width=True, type="primary"):
-            if len(st.session_state.selected_pages) == 0:
+            if st.session_state.selection.count == 0:
                 st.warning("ページを選択してください")
             else:
-                selected_content = []
-                for page in st.session_state.pages_data:
-                    if page['id'] in st.session_state.selected_pages:
-                        selected_content.append(f"# {page['title']}\n\n{page['content']}")
-                
-                combined_text = "\n\n" + "="*80 + "\n\n".join(selected_content)
-                
-                st.text_area(
-                    "以下のテキストを選択してコピーしてください (Ctrl+A → Ctrl+C)",
-                    combined_text,
-                    height=300,
-                    key="copy_area"
-                )
-                st.info("💡 テキストエリア内をクリック → Ctrl+A(全選択) → Ctrl+C(コピー)")
+                export_path = export_selected_pages("txt")
+                if export_path:
+                    combined_text, is_complete = read_text_head(export_path, MAX_DISPLAY_CHARS)
+                    
+                    st.text_area(
+                        "以下のテキストを選択してコピーしてください (Ctrl+A → Ctrl+C)",
+                        combined_text,
+                        height=300,
+                        key="copy_area"
+                    )
+                    if is_complete:
+                        st.info("💡 テキストエリア内をクリック → Ctrl+A(全選択) → Ctrl+C(コピー)")
+                    else:
+                        st.warning(
+                            f"⚠️ 先頭{MAX_DISPLAY_CHARS:,}文字のみ表示しています。"
+                            "全文は「ファイルとして保存」からダウンロードしてください"
+                        )
     
     with col2:
-        if st.button("💾 テキストファイルとして保存", use_container_width=True):
-            if len(st.session_state.selected_pages) == 0:
+        export_label = st.selectbox(
+            "保存形式",
+            options=list(EXPORT_FORMATS.keys()),
+            label_visibility="collapsed"
+        )
+        if st.button("💾 ファイルとして保存", use_container_width=True):
+            if st.session_state.selection.count == 0:
                 st.warning("ページを選択してください")
             else:
-                selected_content = []
-                for page in st.session_state.pages_data:
-                    if page['id'] in st.session_state.selected_pages:
-                        selected_content.append(f"# {page['title']}\n\n{page['content']}")
-                
-                combined_text = "\n\n" + "="*80 + "\n\n".join(selected_content)
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                st.download_button(
-                    label="⬇️ ダウンロード",
-                    data=combined_text,
-                    file_name=f"notion_pages_{timestamp}.txt",
-                    mime="text/plain"
-                )
\ No newline at end of file
+                export_format = EXPORT_FORMATS[export_label]
+                export_path = export_selected_pages(export_format)
+                if export_path:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    
+                    with open(export_path, 'rb') as f:
+                        st.download_button(
+                            label="⬇️ ダウンロード",
+                            data=f,
+                            file_name=f"notion_pages_{timestamp}.{export_format}",
+                            mime=EXPORT_MIME_TYPES[export_format]
+                        )
@@ -0,0 +1,55 @@
+"""ブロックストアの再利用で、編集された子孫のブロックを古い内容のまま使わないことを確認する"""
+import pytest
+from notion_client import Client
+
+from notion_bulk import cache, fetcher
+from notion_bulk.loader import iter_database_pages
+from notion_bulk.mock import MockNotionServer
+
+@pytest.fixture
+def server(tmp_path):
+    cache.set_cache_dir(tmp_path / "cache")
+    fetcher.configure_rate_limit(2000, burst=2000)
+    with MockNotionServer(0, 0, retry_after=0) as server:
+        yield server
+
+def load(server, **kwargs):
+    notion = Client(auth="mock", base_url=server.url)
+    return {page['id']: page['content'] for page in iter_database_pages(notion, "db", None, max_depth=2, **kwargs)}
+
+def load_fresh(server, tmp_path):
+    """ストアを使わずに取得した本文"""
+    cache.set_cache_dir(tmp_path / "fresh")
+    try:
+        return load(server, use_cache=False)
+    finally:
+        cache.set_cache_dir(tmp_path / "cache")
+
+def test_nested_edit_before_top_level_edit_is_refetched(server, tmp_path):
+    database = server.add_database("db", 5, 10, 2, 3)
+    page_id = database.page_ids[0]
+    load(server, use_cache=False)
+    
+    blocks = server.build_blocks(database, page_id)
+    toggle = next(block for block in blocks if block['has_children'])
+    other = next(block for block in blocks if block['id'] != toggle['id'])
+    # 入れ子のブロックを編集した後に別のトップレベルのブロックを編集すると、
+    # ページの更新日時は後者と同じになり、前者の親のブロックの更新日時は変わらない
+    server.touch_block(f"{toggle['id']}.1")
+    server.touch_block(other['id'])
+    
+    contents = load(server, use_cache=False, incremental=True)
+    assert contents[page_id] == load_fresh(server, tmp_path)[page_id]
+
+def test_unchanged_page_reuses_stored_blocks(server, tmp_path):
+    database = server.add_database("db", 5, 10, 2, 3)
+    expected = load(server, use_cache=False)
+    # ページストアから消えても、ページが更新されていなければ保存済みのブロックを使う
+    with cache.get_connection() as conn:
+        conn.execute("DELETE FROM pages")
+    cache.remove_snapshots()
+    server.reset_counts()
+    
+    contents = load(server, use_cache=True)
+    assert contents == expected
+    assert server.counts['blocks.children.list'] == len(database.page_ids)